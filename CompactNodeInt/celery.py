@@ -9,6 +9,9 @@ from datetime import timedelta
 from celery.schedules import crontab
 from dotenv import load_dotenv
 import django
+import logging
+
+logger = logging.getLogger(__name__)
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -59,6 +62,8 @@ app.conf.task_send_sent_event = True
 # Configure beat scheduler
 app.conf.beat_max_loop_interval = 1  # Check schedule every second
 app.conf.beat_schedule_filename = 'celerybeat-schedule'
+# Schedules come from Portal.models.TaskConfig and are reloaded live when it changes
+app.conf.beat_scheduler = 'Portal.schedulers:TaskConfigScheduler'
 
 # Configure task defaults
 app.conf.task_default_queue = 'celery'
@@ -66,65 +71,24 @@ app.conf.task_default_exchange = 'celery'
 app.conf.task_default_routing_key = 'celery'
 app.conf.task_default_delivery_mode = 'persistent'
 
-def get_task_schedule():
-    """
-    Get task schedule from database configurations
-    """
-    try:
-        from Portal.models import TaskConfig
-        
-        schedule = {}
-        
-        # Get enabled tasks from database
-        enabled_tasks = TaskConfig.objects.filter(is_enabled=True)
-        print(f"\nFound {enabled_tasks.count()} enabled tasks in database")
-        
-        for task in enabled_tasks:
-            print(f"Processing task: {task.task_name} (Frequency: {task.frequency}s)")
-            schedule[task.task_name] = {
-                'task': task.task_name,
-                'schedule': timedelta(seconds=float(task.frequency)),  # Convert to timedelta
-                'options': {
-                    'expires': float(task.frequency) - 1.0,
-                    'queue': 'celery'
-                }
-            }
-            print(f"Added task to schedule: {task.task_name}")
-
-        print("\nFinal schedule:", schedule)
-        return schedule
-    except Exception as e:
-        print(f"Error building schedule: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return {}
-
-# Initialize beat schedule
-app.conf.beat_schedule = get_task_schedule()
-
 @app.task
 def update_task_configs():
     """
-    Update task configurations and their next run times
+    Update next run times for enabled tasks.
+    Schedule changes no longer need this task: the beat scheduler reloads
+    TaskConfig by itself whenever a row changes.
     """
     try:
-        print("\nUpdating task configurations...")
-        new_schedule = get_task_schedule()
-        app.conf.beat_schedule = new_schedule
-        
-        # Update next run times in database
         from Portal.models import TaskConfig
-        for task_config in TaskConfig.objects.filter(is_enabled=True):
-            if task_config.last_run:
-                task_config.next_run = task_config.last_run + timedelta(seconds=task_config.frequency)
-                task_config.save()
-                print(f"Updated next run time for {task_config.task_name}")
+        task_configs = list(TaskConfig.objects.filter(is_enabled=True, last_run__isnull=False))
+        for task_config in task_configs:
+            task_config.next_run = task_config.last_run + timedelta(seconds=task_config.frequency)
+        TaskConfig.objects.bulk_update(task_configs, ['next_run'])
+        logger.info(f"Updated next run time for {len(task_configs)} tasks")
         
         return "Schedule updated successfully"
     except Exception as e:
-        print(f"Error updating schedule: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"Error updating schedule: {str(e)}")
         return f"Error updating schedule: {str(e)}"
 
 @task_prerun.connect
@@ -152,12 +116,9 @@ def task_failure_handler(task_id, exception, args, kwargs, traceback, einfo, **_
 @beat_init.connect
 def init_beat(**kwargs):
     """
-    Initialize beat schedule from database
+    Log beat startup; the schedule itself is loaded by TaskConfigScheduler
     """
-    print("\nInitializing beat schedule...")
-    schedule = get_task_schedule()
-    app.conf.beat_schedule = schedule
-    print("Beat schedule initialized")
+    logger.info("Beat started with database-driven schedule")
 
 @worker_ready.connect
 def at_worker_ready(**kwargs):
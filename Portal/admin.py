@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import User
-from .models import UserProfile, TaskConfig, OrderData, MasterInventory, WarehouseLocation
+from .models import UserProfile, TaskConfig, OrderData, MasterInventory, WarehouseLocation, IngestedFile, OrderDataArchive
 from django.utils.html import format_html
 from django.urls import path
 from django.shortcuts import render
@@ -16,6 +16,8 @@ from django.db.models import Count, Q
 from django.utils.translation import gettext_lazy as _
 from import_export import resources
 from import_export.admin import ImportExportModelAdmin
+import redis
+from .utils.locks import get_skipped_runs
 
 class UserProfileInline(admin.StackedInline):
     model = UserProfile
@@ -57,18 +59,30 @@ class CustomUserAdmin(UserAdmin):
         return super(CustomUserAdmin, self).get_inline_instances(request, obj)
 
 class TaskConfigAdmin(admin.ModelAdmin):
-    list_display = ('task_name', 'is_enabled', 'frequency', 'last_run', 'next_run')
+    list_display = ('task_name', 'is_enabled', 'frequency', 'last_run', 'next_run', 'skipped_runs')
     list_filter = ('is_enabled',)
     search_fields = ('task_name',)
     ordering = ('task_name',)
-    readonly_fields = ('last_run', 'next_run')
+    readonly_fields = ('last_run', 'next_run', 'skipped_runs')
     fieldsets = (
         ('Task Configuration', {
-            'fields': ('task_name', 'is_enabled', 'frequency', 'last_run', 'next_run'),
+            'fields': ('task_name', 'is_enabled', 'frequency', 'last_run', 'next_run', 'skipped_runs'),
             'classes': ('wide',)
         }),
     )
 
+    def skipped_runs(self, obj):
+        # Ticks skipped because the previous run still held the task lock;
+        # a steady count means the frequency is shorter than a run takes
+        try:
+            skips = get_skipped_runs().get(obj.task_name)
+        except redis.exceptions.RedisError:
+            return 'Unavailable'
+        if not skips:
+            return 0
+        return f"{skips['count']} (last {skips['last_skipped']})"
+    skipped_runs.short_description = 'Skipped runs'
+
 class OrderDataResource(resources.ModelResource):
     class Meta:
         model = OrderData
@@ -149,9 +163,31 @@ class WarehouseLocationAdmin(ImportExportModelAdmin):
         }),
     )
 
+class IngestedFileAdmin(admin.ModelAdmin):
+    list_display = ('file_name', 'kind', 'outcome', 'row_count', 'size', 'duplicate_count', 'ingested_at')
+    list_filter = ('kind', 'outcome', 'ingested_at')
+    search_fields = ('file_name', 'sha256')
+    readonly_fields = ('kind', 'sha256', 'size', 'file_name', 'row_count', 'outcome', 'duplicate_count', 'ingested_at', 'updated_at')
+    ordering = ('-ingested_at',)
+
+class OrderDataArchiveAdmin(admin.ModelAdmin):
+    list_display = ('order_number', 'order_line', 'transaction_type', 'item', 'quantity', 'actual_qty', 'processed_at', 'archived_at')
+    list_filter = ('transaction_type', 'archived_at')
+    search_fields = ('order_number', 'item', 'user')
+    ordering = ('-archived_at',)
+
+    # Archived lines are history; they are only ever written by the archive task
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 admin.site.unregister(User)
 admin.site.register(User, CustomUserAdmin)
 admin.site.register(TaskConfig, TaskConfigAdmin)
 admin.site.register(OrderData, OrderDataAdmin)
 admin.site.register(MasterInventory, MasterInventoryAdmin)
-admin.site.register(WarehouseLocation, WarehouseLocationAdmin)
\ No newline at end of file
+admin.site.register(WarehouseLocation, WarehouseLocationAdmin)
+admin.site.register(IngestedFile, IngestedFileAdmin)
+admin.site.register(OrderDataArchive, OrderDataArchiveAdmin)
\ No newline at end of file
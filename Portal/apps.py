@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 from .utils.folder_setup import ensure_folders_exist
 
 
@@ -9,6 +10,9 @@ class PortalConfig(AppConfig):
     def ready(self):
         """
         Called when the application is ready.
-        Ensures all required folders exist.
+        Ensures all required folders exist and keeps the search indexes in step after migrations.
         """
         ensure_folders_exist()
+
+        from .utils.search import repair_fulltext_triggers
+        post_migrate.connect(repair_fulltext_triggers, sender=self)
@@ -0,0 +1,80 @@
+import os
+import time
+import tempfile
+import importlib.util
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand
+from Portal.utils.readers import read_table, available_engines, ORDER_COLUMNS
+
+
+class Command(BaseCommand):
+    help = 'Compare the order file readers on a generated workbook'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000, help='Number of order lines to generate')
+        parser.add_argument('--extra-columns', type=int, default=10, help='Unused columns added to every row')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per reader; the best time is reported')
+        parser.add_argument('--keep', action='store_true', help='Keep the generated files')
+
+    def build_frame(self, rows, extra_columns):
+        rng = np.random.default_rng(0)
+        frame = pd.DataFrame({
+            'Order': [f"SO{number:07d}" for number in rng.integers(0, max(rows // 20, 1), rows)],
+            'Type': rng.choice(['PICK', 'PUT'], rows),
+            'Item': [f"ITEM-{number:05d}" for number in rng.integers(0, 50000, rows)],
+            'Quantity': rng.integers(1, 100, rows),
+            'Location': [f"A{number // 100:02d}-{number % 100:02d}" for number in rng.integers(0, 10000, rows)],
+        })
+        for column in range(extra_columns):
+            frame[f'Extra {column + 1}'] = rng.random(rows)
+        return frame
+
+    def time_reader(self, label, read, repeat):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            frame = read()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        self.stdout.write(f'{label:<32} {best:>8.2f}s {len(frame) / best:>12,.0f} rows/s')
+        return best
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        repeat = options['repeat']
+        folder = tempfile.mkdtemp(prefix='reader-benchmark-')
+        frame = self.build_frame(rows, options['extra_columns'])
+
+        self.stdout.write(f'Generating {rows} rows with {len(frame.columns)} columns in {folder}')
+        paths = {'xlsx': os.path.join(folder, 'orders.xlsx'), 'csv': os.path.join(folder, 'orders.csv')}
+        frame.to_excel(paths['xlsx'], index=False)
+        frame.to_csv(paths['csv'], index=False)
+        if importlib.util.find_spec('pyarrow') or importlib.util.find_spec('fastparquet'):
+            paths['parquet'] = os.path.join(folder, 'orders.parquet')
+            frame.to_parquet(paths['parquet'], index=False)
+        for kind, path in paths.items():
+            self.stdout.write(f'  {kind}: {os.path.getsize(path) / 1024 / 1024:.1f} MB')
+
+        self.stdout.write('')
+        self.stdout.write(f'{"Reader":<32} {"Best":>9} {"Throughput":>17}')
+        baseline = self.time_reader('pandas read_excel (all columns)', lambda: pd.read_excel(paths['xlsx']), repeat)
+        results = {}
+        for engine in available_engines():
+            results[f'xlsx {engine}'] = self.time_reader(
+                f'xlsx {engine}', lambda engine=engine: read_table(paths['xlsx'], ORDER_COLUMNS, engine=engine), repeat
+            )
+        for kind in ('csv', 'parquet'):
+            if kind in paths:
+                results[kind] = self.time_reader(kind, lambda kind=kind: read_table(paths[kind], ORDER_COLUMNS), repeat)
+
+        self.stdout.write('')
+        for label, elapsed in results.items():
+            self.stdout.write(f'{label:<32} {baseline / elapsed:>8.1f}x faster than the baseline')
+
+        if options['keep']:
+            self.stdout.write(f'Files kept in {folder}')
+        else:
+            for path in paths.values():
+                os.remove(path)
+            os.rmdir(folder)
@@ -1,10 +1,30 @@
 from django.core.management.base import BaseCommand
 from Portal.models import OrderData
+from Portal.tasks.archive_orders import order_history
 
 class Command(BaseCommand):
     help = 'Check order status in the database'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--order', help='Show every line of one order, including archived lines')
+
+    def show_order(self, order_number):
+        lines = order_history(order_number)
+        if not lines:
+            self.stdout.write(f'Order {order_number} not found')
+            return
+        self.stdout.write(f'\nOrder Number: {order_number}')
+        self.stdout.write(f'Number of Lines: {len(lines)}')
+        for line in lines:
+            where = f"archived {line['archived_at']:%Y-%m-%d}" if line['archived'] else 'live'
+            self.stdout.write(f"  - Line {line['order_line']}: Item: {line['item']}, Quantity: {line['quantity']}, "
+                              f"Status: {line['sent_status']} ({where})")
+
     def handle(self, *args, **options):
+        if options['order']:
+            self.show_order(options['order'])
+            return
+
         # Get counts for different statuses
         total_orders = OrderData.objects.count()
         pending_orders = OrderData.objects.filter(sent_status=0).count()
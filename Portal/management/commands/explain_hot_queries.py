@@ -0,0 +1,78 @@
+import re
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+from Portal.models import OrderData
+
+# Plan fragments that mean the whole order table (or one of its indexes) is read
+FULL_SCAN_PATTERNS = {
+    'sqlite': re.compile(r'\bSCAN (TABLE )?"?Portal_order_data\b'),
+    'postgresql': re.compile(r'Seq Scan on "?Portal_order_data"?'),
+}
+
+
+def hot_queries():
+    """The OrderData queries the background tasks run on every tick"""
+    cutoff = timezone.now() - timedelta(days=1)
+    return [
+        ('create_api_orders: pending lines', OrderData.objects.filter(sent_status=0).order_by(
+            'order_number', 'transaction_type', 'order_line'
+        ).values_list('id', 'order_number', 'transaction_type', 'order_line', 'item', 'quantity', 'bin_location')),
+        ('check_pick_status: open lines', OrderData.objects.filter(
+            sent_status__in=[1, 99], inserted_date__gte=cutoff
+        ).order_by('order_number', 'transaction_type', 'order_line')),
+        ('check_pick_status: timeout sweep', OrderData.objects.filter(sent_status=99, inserted_date__lt=cutoff)),
+        ('export_completed_orders: completed orders', OrderData.objects.filter(
+            order_number__in=OrderData.objects.filter(sent_status=3).values('order_number')
+        ).values('order_number').annotate(
+            total_lines=Count('id'), complete_lines=Count('id', filter=Q(sent_status=3))
+        ).filter(total_lines=F('complete_lines')).order_by('order_number')),
+        ('export_completed_orders: order lines', OrderData.objects.filter(
+            order_number__in=['SO1', 'SO2'], sent_status=3
+        ).order_by('order_number', 'order_line')),
+        ('import: existing order lines', OrderData.objects.filter(order_number__in=['SO1', 'SO2']).values_list('id', 'order_number', 'order_line')),
+        ('home: status count', OrderData.objects.filter(sent_status=1).values('id')),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Show the query plan of each hot OrderData query and fail if any of them scans the whole table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true', help='Print the full plan of every query')
+
+    def explain(self, queryset):
+        if connection.vendor == 'postgresql':
+            # Small tables are cheaper to scan, so ask whether an index could serve the query at all
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+                return queryset.explain()
+        return queryset.explain()
+
+    def handle(self, *args, **options):
+        if not connection.features.supports_explaining_query_execution:
+            raise CommandError(f'The {connection.vendor} backend does not support EXPLAIN through Django')
+
+        full_scan = FULL_SCAN_PATTERNS.get(connection.vendor)
+        if full_scan is None:
+            self.stdout.write(self.style.WARNING(f'No full-scan check for {connection.vendor}; plans are printed only'))
+
+        failures = []
+        for label, queryset in hot_queries():
+            plan = self.explain(queryset)
+            if full_scan is not None and full_scan.search(plan):
+                failures.append(label)
+                self.stdout.write(self.style.ERROR(f'FULL SCAN  {label}'))
+                self.stdout.write(plan)
+                continue
+
+            self.stdout.write(self.style.SUCCESS(f'index      {label}'))
+            if options['verbose_plans'] or full_scan is None:
+                self.stdout.write(plan)
+
+        if failures:
+            raise CommandError(f'{len(failures)} hot queries scan the whole order table: {", ".join(failures)}')
+        self.stdout.write(self.style.SUCCESS('Every hot query is served by an index'))
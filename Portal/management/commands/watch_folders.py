@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from Portal.utils.folder_setup import ensure_folders_exist, get_folder_path
+from Portal.utils.watcher import FolderWatcher
+from Portal.tasks.import_order import process_order_file
+from Portal.tasks.import_inventory import process_inventory_file
+
+
+class Command(BaseCommand):
+    help = 'Watch the order and inventory folders and queue one import task per new file'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--poll',
+            action='store_true',
+            help='List the folders on an interval instead of using file system events',
+        )
+
+    def handle(self, *args, **options):
+        if not ensure_folders_exist():
+            raise CommandError('Could not create watch folders, check WATCH_FOLDER')
+
+        watcher = FolderWatcher(
+            {
+                get_folder_path('orders'): process_order_file.delay,
+                get_folder_path('inventory'): process_inventory_file.delay,
+            },
+            use_events=not options['poll'],
+        )
+
+        mode = 'events' if watcher.use_events else 'polling'
+        self.stdout.write(f'Watching {", ".join(watcher.folders)} ({mode}), press Ctrl+C to stop')
+        try:
+            watcher.run()
+        except KeyboardInterrupt:
+            watcher.stop()
+            self.stdout.write('Stopped watching')
@@ -0,0 +1,55 @@
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+# Order lines deleted per statement while removing duplicates
+DEDUPE_BATCH_SIZE = 500
+
+
+def remove_duplicate_order_lines(apps, schema_editor):
+    """
+    Keep only the newest row of each numbered order line.
+
+    Re-imported files used to store the same order lines again, and the unique
+    constraint below cannot be added while those copies exist. The row with the
+    highest id is the one the last import wrote, so it is the one kept.
+    """
+    OrderData = apps.get_model('Portal', 'OrderData')
+    duplicates = (
+        OrderData.objects.filter(order_line__isnull=False)
+        .values('order_number', 'order_line')
+        .annotate(rows=Count('id'), newest_id=Max('id'))
+        .filter(rows__gt=1)
+    )
+    for group in duplicates.iterator():
+        stale_ids = list(
+            OrderData.objects.filter(order_number=group['order_number'], order_line=group['order_line'])
+            .exclude(id=group['newest_id'])
+            .values_list('id', flat=True)
+        )
+        for start in range(0, len(stale_ids), DEDUPE_BATCH_SIZE):
+            OrderData.objects.filter(id__in=stale_ids[start:start + DEDUPE_BATCH_SIZE]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Portal', '0022_rename_masterinven_item_fe0ce4_idx_portal_mast_item_e4e8ce_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_order_lines, migrations.RunPython.noop),
+        # Lines without a number are exempt, so SQL Server does not treat NULLs as duplicates
+        migrations.AddConstraint(
+            model_name='orderdata',
+            constraint=models.UniqueConstraint(
+                condition=models.Q(('order_line__isnull', False)),
+                fields=('order_number', 'order_line'),
+                name='order_data_order_line_uniq',
+            ),
+        ),
+        # The constraint's index is partial, so lookups by order number alone need their own
+        migrations.AddIndex(
+            model_name='orderdata',
+            index=models.Index(fields=['order_number', 'order_line'], name='order_data_number_line_idx'),
+        ),
+    ]
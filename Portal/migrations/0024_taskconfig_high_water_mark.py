@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Portal', '0023_orderdata_order_data_order_line_uniq'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='taskconfig',
+            name='high_water_mark',
+            field=models.DateTimeField(blank=True, help_text='Newest source record already imported', null=True),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Portal', '0024_taskconfig_high_water_mark'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderdata',
+            name='last_history_id',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Portal', '0025_orderdata_last_history_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestedFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('orders', 'Order File'), ('inventory', 'Inventory File')], max_length=20)),
+                ('sha256', models.CharField(max_length=64)),
+                ('size', models.BigIntegerField()),
+                ('file_name', models.CharField(max_length=255)),
+                ('row_count', models.IntegerField(default=0)),
+                ('outcome', models.CharField(choices=[('processed', 'Processed'), ('error', 'Error')], max_length=20)),
+                ('duplicate_count', models.IntegerField(default=0, help_text='Times the same content was dropped again')),
+                ('ingested_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Ingested File',
+                'verbose_name_plural': 'Ingested Files',
+                'db_table': 'Portal_ingested_file',
+                'constraints': [models.UniqueConstraint(fields=('kind', 'sha256'), name='ingested_file_kind_sha256_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Portal', '0026_ingestedfile'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='orderdata',
+            index=models.Index(fields=['sent_status', 'order_number', 'transaction_type', 'order_line'], name='order_data_status_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orderdata',
+            index=models.Index(fields=['sent_status', 'inserted_date'], name='order_data_status_inserted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orderdata',
+            index=models.Index(condition=models.Q(('sent_status__in', [1, 99])), fields=['order_number', 'transaction_type', 'order_line'], name='order_data_open_lines_idx'),
+        ),
+    ]
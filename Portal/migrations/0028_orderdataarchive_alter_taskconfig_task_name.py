@@ -0,0 +1,59 @@
+from django.db import migrations, models
+
+ARCHIVE_TASK = 'Portal.tasks.archive_orders.archive_exported_orders'
+
+
+def add_archive_task_config(apps, schema_editor):
+    # Beat only schedules tasks with a TaskConfig row; hourly keeps each run small
+    TaskConfig = apps.get_model('Portal', 'TaskConfig')
+    TaskConfig.objects.get_or_create(task_name=ARCHIVE_TASK, defaults={'is_enabled': True, 'frequency': 3600})
+
+
+def remove_archive_task_config(apps, schema_editor):
+    TaskConfig = apps.get_model('Portal', 'TaskConfig')
+    TaskConfig.objects.filter(task_name=ARCHIVE_TASK).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Portal', '0027_orderdata_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='taskconfig',
+            name='task_name',
+            field=models.CharField(choices=[('Portal.tasks.import_order.process_excel_files', 'Excel - Order File Import'), ('Portal.tasks.api_order_creation.create_api_orders', 'API - Create Orders'), ('Portal.tasks.check_pick_status', 'API - Check Order Status'), ('Portal.tasks.import_inventory.process_inventory_files', 'Excel - Inventory File Import'), ('Portal.tasks.api_inventory.api_inventory_creation', 'API - Create Inventory API'), ('Portal.tasks.export_order.export_completed_orders', 'Excel - Order Export'), ('Portal.tasks.archive_orders.archive_exported_orders', 'Database - Order Archive')], max_length=255, unique=True),
+        ),
+        migrations.CreateModel(
+            name='OrderDataArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('original_id', models.IntegerField()),
+                ('order_number', models.CharField(max_length=50)),
+                ('transaction_type', models.CharField(max_length=50)),
+                ('item', models.CharField(max_length=50)),
+                ('quantity', models.IntegerField()),
+                ('actual_qty', models.IntegerField(blank=True, null=True)),
+                ('processed_at', models.DateTimeField()),
+                ('file_name', models.CharField(max_length=255)),
+                ('sent_status', models.IntegerField(default=4)),
+                ('api_error', models.TextField(blank=True, null=True)),
+                ('user', models.CharField(blank=True, max_length=255, null=True)),
+                ('wms_location', models.CharField(blank=True, max_length=255, null=True)),
+                ('bin_location', models.CharField(blank=True, max_length=255, null=True)),
+                ('order_line', models.IntegerField(blank=True, null=True)),
+                ('inserted_date', models.DateTimeField(blank=True, null=True)),
+                ('shortage_qty', models.IntegerField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Archived Order Line',
+                'verbose_name_plural': 'Archived Order Lines',
+                'db_table': 'Portal_order_data_archive',
+                'indexes': [models.Index(fields=['order_number', 'order_line'], name='order_archive_number_idx'), models.Index(fields=['archived_at'], name='order_archive_archived_idx')],
+            },
+        ),
+        migrations.RunPython(add_archive_task_config, remove_archive_task_config),
+    ]
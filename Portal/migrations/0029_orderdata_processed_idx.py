@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Portal', '0028_orderdataarchive_alter_taskconfig_task_name'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='orderdata',
+            index=models.Index(fields=['processed_at', 'id'], name='order_data_processed_idx'),
+        ),
+    ]
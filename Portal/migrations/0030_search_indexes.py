@@ -0,0 +1,105 @@
+import logging
+from django.db import migrations, DatabaseError
+
+logger = logging.getLogger(__name__)
+
+# Table, searched columns and full-text table name for each searchable model.
+# SQL Server gets no index: its full-text search matches word prefixes, not the
+# substrings icontains finds, so searches there keep using icontains.
+SEARCH_TABLES = [
+    ('Portal_order_data', ['order_number', 'item'], 'Portal_order_data_fts'),
+    ('Portal_masterinventory_data', ['item', 'description'], 'Portal_masterinventory_fts'),
+]
+
+
+def create_sqlite_triggers(cursor, table, columns, fts_table):
+    """Create the triggers keeping an FTS5 table in step with its content table"""
+    column_list = ', '.join(columns)
+    new_values = ', '.join(f'new.{column}' for column in columns)
+    old_values = ', '.join(f'old.{column}' for column in columns)
+    cursor.execute(
+        f'CREATE TRIGGER "{fts_table}_ai" AFTER INSERT ON "{table}" BEGIN '
+        f'INSERT INTO "{fts_table}"(rowid, {column_list}) VALUES (new.id, {new_values}); END'
+    )
+    cursor.execute(
+        f'CREATE TRIGGER "{fts_table}_ad" AFTER DELETE ON "{table}" BEGIN '
+        f'INSERT INTO "{fts_table}"("{fts_table}", rowid, {column_list}) VALUES (\'delete\', old.id, {old_values}); END'
+    )
+    cursor.execute(
+        f'CREATE TRIGGER "{fts_table}_au" AFTER UPDATE OF {column_list} ON "{table}" BEGIN '
+        f'INSERT INTO "{fts_table}"("{fts_table}", rowid, {column_list}) VALUES (\'delete\', old.id, {old_values}); '
+        f'INSERT INTO "{fts_table}"(rowid, {column_list}) VALUES (new.id, {new_values}); END'
+    )
+
+
+def _sqlite_forwards(cursor):
+    # External-content FTS5 tables with the trigram tokenizer, kept in step by
+    # triggers. SQLite migrations which rebuild these tables drop the triggers;
+    # Portal.utils.search.repair_fulltext_triggers() recreates them after migrate.
+    for table, columns, fts_table in SEARCH_TABLES:
+        column_list = ', '.join(columns)
+        cursor.execute(
+            f'CREATE VIRTUAL TABLE "{fts_table}" USING fts5({column_list}, '
+            f"content='{table}', content_rowid='id', tokenize='trigram')"
+        )
+        create_sqlite_triggers(cursor, table, columns, fts_table)
+        cursor.execute(f'INSERT INTO "{fts_table}"("{fts_table}") VALUES (\'rebuild\')')
+
+
+def _sqlite_backwards(cursor):
+    for table, columns, fts_table in SEARCH_TABLES:
+        for suffix in ('ai', 'ad', 'au'):
+            cursor.execute(f'DROP TRIGGER IF EXISTS "{fts_table}_{suffix}"')
+        cursor.execute(f'DROP TABLE IF EXISTS "{fts_table}"')
+
+
+def _postgresql_forwards(cursor):
+    # icontains compiles to UPPER(column::text) LIKE UPPER(%s), which these serve
+    cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table, columns, fts_table in SEARCH_TABLES:
+        for column in columns:
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS "{table}_{column}_trgm" ON "{table}" '
+                f'USING gin (UPPER("{column}"::text) gin_trgm_ops)'
+            )
+
+
+def _postgresql_backwards(cursor):
+    for table, columns, fts_table in SEARCH_TABLES:
+        for column in columns:
+            cursor.execute(f'DROP INDEX IF EXISTS "{table}_{column}_trgm"')
+
+
+FORWARDS = {'sqlite': _sqlite_forwards, 'postgresql': _postgresql_forwards}
+BACKWARDS = {'sqlite': _sqlite_backwards, 'postgresql': _postgresql_backwards}
+
+
+def create_search_indexes(apps, schema_editor):
+    forwards = FORWARDS.get(schema_editor.connection.vendor)
+    if forwards is None:
+        return
+    with schema_editor.connection.cursor() as cursor:
+        try:
+            forwards(cursor)
+        except DatabaseError as e:
+            # Search still works without the indexes, only slower
+            logger.warning(f"Could not create search indexes: {str(e)}")
+            BACKWARDS[schema_editor.connection.vendor](cursor)
+
+
+def drop_search_indexes(apps, schema_editor):
+    backwards = BACKWARDS.get(schema_editor.connection.vendor)
+    if backwards is not None:
+        with schema_editor.connection.cursor() as cursor:
+            backwards(cursor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Portal', '0029_orderdata_processed_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Portal', '0030_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='taskconfig',
+            name='high_water_order_line',
+            field=models.IntegerField(blank=True, help_text='Order line of the last source record imported', null=True),
+        ),
+        migrations.AddField(
+            model_name='taskconfig',
+            name='high_water_order_number',
+            field=models.CharField(blank=True, help_text='Order number of the last source record imported', max_length=50, null=True),
+        ),
+    ]
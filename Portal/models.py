@@ -33,12 +33,70 @@ class OrderData(models.Model):
     order_line = models.IntegerField(null=True, blank=True)
     inserted_date = models.DateTimeField(auto_now_add=True, null=True, blank=True)
     shortage_qty = models.IntegerField(null=True, blank=True)
+    last_history_id = models.IntegerField(null=True, blank=True)
 
     def __str__(self):
         return f"{self.order_number} - {self.item}"
 
     class Meta:
         db_table = 'Portal_order_data'
+        constraints = [
+            # Lines without a number are exempt, so SQL Server does not treat NULLs as duplicates
+            models.UniqueConstraint(
+                fields=['order_number', 'order_line'],
+                condition=models.Q(order_line__isnull=False),
+                name='order_data_order_line_uniq',
+            ),
+        ]
+        indexes = [
+            # Lines by status in order sequence: pending pushes, completed exports, status counts
+            models.Index(fields=['sent_status', 'order_number', 'transaction_type', 'order_line'], name='order_data_status_order_idx'),
+            # Age of lines per status: the stuck-line timeout sweep
+            models.Index(fields=['sent_status', 'inserted_date'], name='order_data_status_inserted_idx'),
+            # Lines still waiting on pick confirmation, polled by check_pick_status
+            models.Index(
+                fields=['order_number', 'transaction_type', 'order_line'],
+                name='order_data_open_lines_idx',
+                condition=models.Q(sent_status__in=[1, 99]),
+            ),
+            # Newest-first order grid, paged by seeking past (processed_at, id)
+            models.Index(fields=['processed_at', 'id'], name='order_data_processed_idx'),
+            # Every line of given orders: import duplicate checks and completed-order totals.
+            # The unique constraint's index is partial, so it cannot serve lookups by order number.
+            models.Index(fields=['order_number', 'order_line'], name='order_data_number_line_idx'),
+        ]
+
+class OrderDataArchive(models.Model):
+    # Exported order lines moved out of OrderData by the archive task
+    original_id = models.IntegerField()
+    order_number = models.CharField(max_length=50)
+    transaction_type = models.CharField(max_length=50)
+    item = models.CharField(max_length=50)
+    quantity = models.IntegerField()
+    actual_qty = models.IntegerField(null=True, blank=True)
+    processed_at = models.DateTimeField()
+    file_name = models.CharField(max_length=255)
+    sent_status = models.IntegerField(default=4)
+    api_error = models.TextField(null=True, blank=True)
+    user = models.CharField(max_length=255, null=True, blank=True)
+    wms_location = models.CharField(max_length=255, null=True, blank=True)
+    bin_location = models.CharField(max_length=255, null=True, blank=True)
+    order_line = models.IntegerField(null=True, blank=True)
+    inserted_date = models.DateTimeField(null=True, blank=True)
+    shortage_qty = models.IntegerField(null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.order_number} - {self.item} (archived)"
+
+    class Meta:
+        db_table = 'Portal_order_data_archive'
+        verbose_name = 'Archived Order Line'
+        verbose_name_plural = 'Archived Order Lines'
+        indexes = [
+            models.Index(fields=['order_number', 'order_line'], name='order_archive_number_idx'),
+            models.Index(fields=['archived_at'], name='order_archive_archived_idx'),
+        ]
 
 class MasterInventory(models.Model):
     # Mandatory fields
@@ -70,6 +128,38 @@ class MasterInventory(models.Model):
 
 
 
+class IngestedFile(models.Model):
+    KIND_CHOICES = [
+        ('orders', 'Order File'),
+        ('inventory', 'Inventory File'),
+    ]
+    OUTCOME_CHOICES = [
+        ('processed', 'Processed'),
+        ('error', 'Error'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    sha256 = models.CharField(max_length=64)
+    size = models.BigIntegerField()
+    file_name = models.CharField(max_length=255)
+    row_count = models.IntegerField(default=0)
+    outcome = models.CharField(max_length=20, choices=OUTCOME_CHOICES)
+    duplicate_count = models.IntegerField(default=0, help_text="Times the same content was dropped again")
+    ingested_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'Portal_ingested_file'
+        verbose_name = 'Ingested File'
+        verbose_name_plural = 'Ingested Files'
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'sha256'], name='ingested_file_kind_sha256_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.file_name} ({self.get_outcome_display()})"
+
+
 # Warehouse location matrix)
 
 class WarehouseLocation(models.Model):
@@ -94,6 +184,7 @@ class TaskConfig(models.Model):
         ('Portal.tasks.import_inventory.process_inventory_files', 'Excel - Inventory File Import'),
         ('Portal.tasks.api_inventory.api_inventory_creation', 'API - Create Inventory API'),
         ('Portal.tasks.export_order.export_completed_orders', 'Excel - Order Export'),
+        ('Portal.tasks.archive_orders.archive_exported_orders', 'Database - Order Archive'),
     ]
 
     task_name = models.CharField(max_length=255, choices=TASK_CHOICES, unique=True)
@@ -101,6 +192,9 @@ class TaskConfig(models.Model):
     frequency = models.IntegerField(default=60, help_text="Frequency in seconds")
     last_run = models.DateTimeField(null=True, blank=True)
     next_run = models.DateTimeField(null=True, blank=True)
+    high_water_mark = models.DateTimeField(null=True, blank=True, help_text="Newest source record already imported")
+    high_water_order_number = models.CharField(max_length=50, null=True, blank=True, help_text="Order number of the last source record imported")
+    high_water_order_line = models.IntegerField(null=True, blank=True, help_text="Order line of the last source record imported")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
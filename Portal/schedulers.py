@@ -0,0 +1,135 @@
+import os
+import time
+import logging
+from datetime import timedelta
+from celery.beat import Scheduler
+from django.db import DatabaseError, close_old_connections
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks of TaskConfig for changes, and between flushes of run times
+SCHEDULE_SYNC_INTERVAL = int(os.getenv('BEAT_SCHEDULE_SYNC_INTERVAL', '5'))
+
+# TaskConfig columns a schedule is built from; a change to any of them reloads it
+SCHEDULE_FIELDS = ('id', 'task_name', 'is_enabled', 'frequency')
+
+
+def get_task_schedule():
+    """
+    Build a beat schedule from the enabled TaskConfig rows.
+
+    Returns:
+        dict: Beat schedule entries keyed by task name
+    """
+    from Portal.models import TaskConfig
+
+    schedule = {}
+    for task in TaskConfig.objects.filter(is_enabled=True):
+        schedule[task.task_name] = {
+            'task': task.task_name,
+            'schedule': timedelta(seconds=float(task.frequency)),
+            'last_run_at': task.last_run,
+            'options': {
+                'expires': max(float(task.frequency) - 1.0, 1.0),
+                'queue': 'celery'
+            }
+        }
+    return schedule
+
+
+class TaskConfigScheduler(Scheduler):
+    """
+    Celery beat scheduler backed by Portal.models.TaskConfig.
+
+    Reads the scheduling columns of every TaskConfig row (one row per task)
+    every BEAT_SCHEDULE_SYNC_INTERVAL seconds and reloads the schedule only
+    when they differ from the last load, so added, edited and deleted tasks
+    apply without restarting beat, however close together the changes are.
+    Run times are collected in memory and written back to last_run/next_run in
+    one bulk update per sync.
+
+    Enable with:
+        app.conf.beat_scheduler = 'Portal.schedulers:TaskConfigScheduler'
+    """
+
+    sync_every = SCHEDULE_SYNC_INTERVAL
+
+    def __init__(self, *args, **kwargs):
+        self._watermark = None
+        self._last_check = 0
+        self._pending_runs = {}
+        super().__init__(*args, **kwargs)
+
+    def setup_schedule(self):
+        self.refresh_schedule(force=True)
+
+    def get_schedule(self):
+        if time.monotonic() - self._last_check >= SCHEDULE_SYNC_INTERVAL:
+            try:
+                self.refresh_schedule()
+            except DatabaseError as e:
+                logger.error(f"Could not reload task schedule, keeping the current one: {str(e)}")
+        return self.data
+
+    def set_schedule(self, schedule):
+        self.data = schedule
+
+    schedule = property(get_schedule, set_schedule)
+
+    def refresh_schedule(self, force=False):
+        """Reload entries from TaskConfig if the table changed since the last load"""
+        from Portal.models import TaskConfig
+
+        self._last_check = time.monotonic()
+        close_old_connections()
+        watermark = tuple(TaskConfig.objects.order_by('id').values_list(*SCHEDULE_FIELDS))
+        if not force and watermark == self._watermark:
+            return
+
+        # Existing entries keep their last run time; only editable fields are replaced.
+        # Works on self.data directly since self.schedule would trigger another refresh.
+        schedule = get_task_schedule()
+        for name in set(self.data) - set(schedule):
+            del self.data[name]
+        for name, fields in schedule.items():
+            entry = self.Entry(**dict(fields, name=name, app=self.app))
+            if name in self.data:
+                self.data[name].update(entry)
+            else:
+                self.data[name] = entry
+        self._watermark = watermark
+        # Entries are updated in place, so force beat to rebuild its heap
+        self._heap = None
+        logger.info("Loaded task schedule: " + ", ".join(
+            f"{name} every {entry.schedule.run_every.total_seconds():g}s" for name, entry in self.data.items()
+        ))
+
+    def reserve(self, entry):
+        new_entry = super().reserve(entry)
+        self._pending_runs[entry.name] = new_entry.last_run_at
+        return new_entry
+
+    def sync(self):
+        """Write collected run times to TaskConfig in a single bulk update"""
+        from Portal.models import TaskConfig
+
+        if not self._pending_runs:
+            return
+        runs, self._pending_runs = self._pending_runs, {}
+
+        try:
+            close_old_connections()
+            configs = list(TaskConfig.objects.filter(task_name__in=runs))
+            for config in configs:
+                config.last_run = runs[config.task_name]
+                config.next_run = config.last_run + timedelta(seconds=config.frequency)
+            # Run times are not part of the watermark, so these writes do not trigger a reload
+            TaskConfig.objects.bulk_update(configs, ['last_run', 'next_run'])
+        except DatabaseError as e:
+            logger.error(f"Could not record task run times: {str(e)}")
+            # Keep the newest known run time for the next attempt
+            self._pending_runs = {**runs, **self._pending_runs}
+
+    @property
+    def info(self):
+        return f"    . db -> TaskConfig (checked every {SCHEDULE_SYNC_INTERVAL}s)"
@@ -13,32 +13,39 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'CompactNodeInt.settings')
 django.setup()
 
 # Import tasks after Django is initialized
-from .import_order import process_excel_files
+from .import_order import process_excel_files, process_order_file
 from .api_order_creation import create_api_orders
 from .check_pick_status import check_pick_status
-from .import_inventory import process_inventory_files
+from .import_inventory import process_inventory_files, process_inventory_file
 from .api_inventory import api_inventory_creation
 from .export_order import export_completed_orders
 from .import_db_orders import process_staging_orders
+from .archive_orders import archive_exported_orders
 
 # Register all tasks
 __all__ = [
     'process_excel_files',
+    'process_order_file',
     'create_api_orders',
     'check_pick_status',
     'process_inventory_files',
+    'process_inventory_file',
     'api_inventory_creation',
     'export_completed_orders',
     'process_staging_orders',
+    'archive_exported_orders',
 ]
 
 # Ensure tasks are registered with Celery
 tasks = [
     process_excel_files,
+    process_order_file,
     create_api_orders,
     check_pick_status,
     process_inventory_files,
+    process_inventory_file,
     api_inventory_creation,
     export_completed_orders,
     process_staging_orders,
+    archive_exported_orders,
 ] 
\ No newline at end of file
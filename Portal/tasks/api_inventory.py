@@ -1,20 +1,128 @@
 import os
 import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from celery import shared_task
 from django.conf import settings
 from Portal.models import MasterInventory
+from Portal.utils.locks import single_instance
+from Portal.utils.http import build_session
+from Portal.utils.events import publish_inventory_update
+from Portal.utils.batching import chunked, IN_CLAUSE_BATCH_SIZE
 import logging
 from datetime import datetime
 
 # Set up logger
 logger = logging.getLogger('inventory_api')
 
+# Maximum number of items in flight to the API at once
+INVENTORY_PUSH_CONCURRENCY = int(os.getenv('INVENTORY_PUSH_CONCURRENCY', '8'))
+
+# Items pushed between status writes
+INVENTORY_PUSH_BATCH_SIZE = int(os.getenv('INVENTORY_PUSH_BATCH_SIZE', '500'))
+
+# Only the columns the payload and status write need are loaded
+PAYLOAD_FIELDS = ['id', 'item', 'description', 'uom', 'cus1', 'cus2', 'cus3', 'status']
+
+
+def iter_pending_batches(batch_size=INVENTORY_PUSH_BATCH_SIZE):
+    """
+    Yield pending inventory items in id order, one page of `batch_size` at a time.
+
+    Pages are fetched by keyset (id greater than the last id seen) rather than
+    by holding one queryset open, so only one page is in memory at once.
+    Because every pushed page has its status written before the next page is
+    read, a run that stops part way continues from the first unpushed item
+    next time.
+    """
+    last_id = 0
+    while True:
+        batch = list(
+            MasterInventory.objects.filter(status=0, id__gt=last_id)
+            .order_by('id')
+            .only(*PAYLOAD_FIELDS)[:batch_size]
+        )
+        if not batch:
+            return
+        yield batch
+        last_id = batch[-1].id
+
+
+def build_item_payload(item):
+    """Build the /api/item/ payload for an inventory item"""
+    return {
+        "name": item.item,
+        "info1": item.description,
+        "info2": item.cus1 or "",
+        "info3": item.cus2 or "",
+        "info4": item.cus3 or "",
+        "info5": "",
+        "image_link": "",
+        "item_code": "",
+        "item_category": "",
+        "unit": item.uom,
+        "unit_weight": 0,
+        "critical_stock_level": 0,
+        "quantity": 0
+    }
+
+
+def push_item(session, api_url, item_name, payload):
+    """
+    Post a single inventory item to the API.
+
+    Runs on a worker thread, so it only talks HTTP and leaves database writes to the caller.
+
+    Returns:
+        int: New item status - 1 on success, 2 on failure
+    """
+    try:
+        logger.info(f"Processing inventory item: {item_name}")
+        logger.debug(f"API payload: {payload}")
+        
+        response = session.post(api_url, json=payload, timeout=30)
+        
+        if response.status_code == 201:
+            logger.info(f"Successfully created inventory item: {item_name}")
+            return 1
+        logger.error(f"API error for item {item_name}: {response.text}")
+        return 2
+        
+    except requests.exceptions.RequestException as req_error:
+        # Handle request errors
+        logger.error(f"Request error for item {item_name}: {str(req_error)}")
+        return 2
+        
+    except Exception as item_error:
+        # Handle other errors
+        logger.error(f"Error processing item {item_name}: {str(item_error)}")
+        return 2
+
+def write_push_results(batch):
+    """
+    Write the new status of each pushed item, one statement per outcome.
+
+    Only items still pending (status 0) are written, so an item whose status
+    changed while its push was in flight keeps the newer status.
+
+    Returns:
+        int: Items left unwritten because their status had changed
+    """
+    written = 0
+    for status in (1, 2):
+        ids = [item.id for item in batch if item.status == status]
+        for id_batch in chunked(ids, IN_CLAUSE_BATCH_SIZE):
+            written += MasterInventory.objects.filter(pk__in=id_batch, status=0).update(status=status)
+    return len(batch) - written
+
 @shared_task(name='Portal.tasks.api_inventory.api_inventory_creation')
+@single_instance()
 def api_inventory_creation():
     """
     Task to push new/pending inventory items to the external API system.
     Only processes items with status = 0 (pending).
-    Updates status to 1 (processed) after successful API push.
+    Updates status to 1 (processed) after successful API push, 2 on failure.
+    Items are posted in parallel, up to INVENTORY_PUSH_CONCURRENCY at a time,
+    and statuses are written per batch, only for items still pending.
     """
     try:
         # Get API configuration from settings
@@ -29,73 +137,36 @@ def api_inventory_creation():
             logger.info("No pending inventory items to process")
             return "No items to process"
 
+        api_url = f"{api_host}/api/item/"
         success_count = 0
         error_count = 0
         
-        for item in pending_items:
-            try:
-                # Prepare API payload according to required format
-                payload = {
-                    "name": item.item,
-                    "info1": item.description,
-                    "info2": item.cus1 or "",
-                    "info3": item.cus2 or "",
-                    "info4": item.cus3 or "",
-                    "info5": "",
-                    "image_link": "",
-                    "item_code": "",
-                    "item_category": "",
-                    "unit": item.uom,
-                    "unit_weight": 0,
-                    "critical_stock_level": 0,
-                    "quantity": 0
+        # Post items in parallel over one keep-alive session
+        with build_session(INVENTORY_PUSH_CONCURRENCY) as session, \
+                ThreadPoolExecutor(max_workers=INVENTORY_PUSH_CONCURRENCY) as executor:
+            for batch in iter_pending_batches():
+                futures = {
+                    executor.submit(push_item, session, api_url, item.item, build_item_payload(item)): item
+                    for item in batch
                 }
+                for future in as_completed(futures):
+                    item = futures[future]
+                    item.status = future.result()
+                    if item.status == 1:
+                        success_count += 1
+                    else:
+                        error_count += 1
                 
-                logger.info(f"Processing inventory item: {item.item}")
-                logger.debug(f"API payload: {payload}")
-                
-                # Make API request
-                response = requests.post(
-                    f"{api_host}/api/item/",
-                    json=payload,
-                    timeout=30
-                )
-                
-                if response.status_code == 201:
-                    # Update status to success
-                    item.status = 1
-                    item.save()
-                    success_count += 1
-                    logger.info(f"Successfully created inventory item: {item.item}")
-                else:
-                    # Update status to error
-                    item.status = 2
-                    item.save()
-                    error_count += 1
-                    logger.error(f"API error for item {item.item}: {response.text}")
-                    
-            except requests.exceptions.RequestException as req_error:
-                # Handle request errors
-                item.status = 2
-                item.save()
-                error_count += 1
-                logger.error(f"Request error for item {item.item}: {str(req_error)}")
-                
-            except Exception as item_error:
-                # Handle other errors
-                item.status = 2
-                item.save()
-                error_count += 1
-                logger.error(f"Error processing item {item.item}: {str(item_error)}")
+                # Status writes stay on this thread, guarded against concurrent changes
+                stale_count = write_push_results(batch)
+                if stale_count:
+                    logger.warning(f"{stale_count} items changed status while being pushed; kept their new status")
+                batch_sent = sum(1 for item in batch if item.status == 1)
+                publish_inventory_update('api_inventory_creation', sent=batch_sent, failed=len(batch) - batch_sent)
+                logger.info(f"Pushed {success_count + error_count} items so far: {success_count} successful, {error_count} failed")
 
         return f"Processed {success_count + error_count} items: {success_count} successful, {error_count} failed"
         
     except Exception as e:
         logger.error(f"Critical error in api_inventory_creation: {str(e)}")
-        return f"Error: {str(e)}"
-
-    return {
-        'total': total_items,
-        'success': success_count,
-        'errors': error_count
-    } 
\ No newline at end of file
+        return f"Error: {str(e)}" 
\ No newline at end of file
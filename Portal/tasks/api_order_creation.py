@@ -1,15 +1,161 @@
 import os
 import json
+from collections import defaultdict
+from itertools import groupby
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from celery import shared_task
 import requests
 from django.db.models import Count
 from Portal.models import OrderData
 from dotenv import load_dotenv
 from Portal.utils.logger import api_logger as logger
+from Portal.utils.http import build_session
+from Portal.utils.batching import chunked, IN_CLAUSE_BATCH_SIZE
+from Portal.utils.locks import single_instance
+from Portal.utils.kpis import invalidate_order_kpis
+from Portal.utils.events import publish_order_update
 
 load_dotenv()
 
+# Maximum number of orders in flight to the API at once
+API_ORDER_CONCURRENCY = int(os.getenv('API_ORDER_CONCURRENCY', '8'))
+
+# Number of orders queued on the thread pool at a time
+API_ORDER_BATCH_SIZE = int(os.getenv('API_ORDER_BATCH_SIZE', '500'))
+
+# Completed orders whose statuses are written back together. A worker that dies
+# mid-run leaves at most this many accepted orders to be posted again.
+API_STATUS_FLUSH_SIZE = int(os.getenv('API_STATUS_FLUSH_SIZE', '25'))
+
+
+def group_order_lines(pending_lines, warehouse):
+    """
+    Group pending lines into one API payload per order.
+
+    Expects (id, order_number, transaction_type, order_line, item, quantity, bin_location)
+    tuples ordered by order number, transaction type and line.
+
+    Returns:
+        list: (order_number, transaction_type, line_ids, payload) tuples
+    """
+    orders = []
+    for (order_number, transaction_type), lines in groupby(pending_lines, key=lambda line: (line[1], line[2])):
+        lines = list(lines)
+        
+        # Set order_type based on transaction_type
+        order_type = 4 if transaction_type == 'PICK' else 3  # 4 for PICK, 3 for PUT
+        
+        # Prepare API payload, using the stored order_line number for each line
+        payload = {
+            "name": order_number,
+            "warehouse": warehouse,
+            "order_type": order_type,  # Dynamic based on transaction_type
+            "order_lines": [
+                {
+                    "line_number": order_line,
+                    "item": item,
+                    "quantity": quantity,
+                    "suggested_bin": bin_location if bin_location else ""  # Empty string if bin_location is NULL
+                }
+                for _, _, _, order_line, item, quantity, bin_location in lines
+            ]
+        }
+        
+        logger.info(f"Prepared {transaction_type} order {order_number} with {len(lines)} lines")
+        logger.debug(json.dumps(payload, indent=2))
+        
+        orders.append((order_number, transaction_type, [line[0] for line in lines], payload))
+    
+    return orders
+
+
+def update_line_status(line_ids, **fields):
+    """Apply the same status update to the given lines, one UPDATE per IN-clause batch"""
+    for batch in chunked(line_ids, IN_CLAUSE_BATCH_SIZE):
+        OrderData.objects.filter(id__in=batch).update(**fields)
+    invalidate_order_kpis()
+
+
+def write_statuses(sent_line_ids, failed_line_ids):
+    """
+    Record the outcome of completed orders.
+
+    One UPDATE for the sent lines and one per distinct error message. Messages
+    leave out the order number, which the line already holds, so orders failing
+    the same way share an UPDATE.
+    """
+    update_line_status(sent_line_ids, sent_status=1)
+    for error_message, line_ids in failed_line_ids.items():
+        update_line_status(line_ids, sent_status=99, api_error=error_message)
+    failed_lines = sum(len(line_ids) for line_ids in failed_line_ids.values())
+    logger.debug(f"Updated {len(sent_line_ids)} lines to sent_status=1 and {failed_lines} lines to sent_status=99")
+    publish_order_update('create_api_orders', sent=len(sent_line_ids), failed=failed_lines)
+
+
+def send_order(session, api_url, order_number, transaction_type, payload):
+    """
+    Post a single order to the API.
+
+    Runs on a worker thread, so it only talks HTTP and leaves database writes to the caller.
+
+    Returns:
+        tuple: (sent_status, api_error) - (1, None) on success, (99, message) on failure
+    """
+    try:
+        # Make API request with timeout
+        logger.info(f"Sending request to API for {transaction_type} order {order_number}")
+        logger.debug(f"Request URL: {api_url}")
+        logger.debug(f"Request Headers: {{'Content-Type': 'application/json'}}")
+
+        response = session.post(
+            api_url,
+            json=payload,
+            timeout=30,  # 30 seconds timeout
+            headers={'Content-Type': 'application/json'}
+        )
+
+        # Log response details
+        logger.info(f"Response Status Code for {transaction_type} order {order_number}: {response.status_code}")
+        logger.debug(f"Response Headers: {dict(response.headers)}")
+
+        try:
+            response_json = response.json()
+            logger.debug(f"Response Body: {json.dumps(response_json, indent=2)}")
+        except json.JSONDecodeError:
+            logger.warning(f"Response not JSON. Text: {response.text[:500]}")
+
+        response.raise_for_status()
+        return 1, None
+
+    except requests.exceptions.Timeout:
+        error_message = "Timeout while connecting to API"
+        logger.error(f"{error_message} for {transaction_type} order {order_number}")
+        logger.debug(f"Request timed out after 30 seconds")
+        return 99, error_message
+
+    except requests.exceptions.ConnectionError as e:
+        error_message = f"Connection error: {str(e)}"
+        logger.error(f"Connection error for {transaction_type} order {order_number}: {str(e)}")
+        logger.debug(f"Connection Details: URL={api_url}")
+        logger.exception("Full connection error traceback:")
+        return 99, error_message
+
+    except requests.exceptions.RequestException as e:
+        error_message = f"API error: {str(e)}"
+        logger.error(f"API error for {transaction_type} order {order_number}: {str(e)}")
+        logger.exception("Full API error traceback:")
+        return 99, error_message
+
+    except Exception as e:
+        # Anything else would surface from future.result() and abort the batch
+        error_message = f"Unexpected error: {str(e)}"
+        logger.error(f"Unexpected error sending {transaction_type} order {order_number}: {str(e)}")
+        logger.exception("Full traceback:")
+        return 99, error_message
+
+
 @shared_task(name='Portal.tasks.api_order_creation.create_api_orders')
+@single_instance()
 def create_api_orders():
     """
     Task to create orders via API for records with sent_status = 0
@@ -17,6 +163,7 @@ def create_api_orders():
     Order type is determined by transaction_type:
     - PUT orders: order_type = 3
     - PICK orders: order_type = 4
+    Orders are posted in parallel, up to API_ORDER_CONCURRENCY at a time
     """
     logger.info("="*80)
     logger.info("Starting API order creation task")
@@ -25,14 +172,17 @@ def create_api_orders():
         # Get configuration
         api_host = os.getenv('API_HOST')
         warehouse = os.getenv('WAREHOUSE')
-        logger.debug(f"Configuration - API Host: {api_host}, Warehouse: {warehouse}")
+        logger.debug(f"Configuration - API Host: {api_host}, Warehouse: {warehouse}, Concurrency: {API_ORDER_CONCURRENCY}")
         
-        # Get all pending orders grouped by order number
-        pending_orders = OrderData.objects.filter(sent_status=0).values('order_number', 'transaction_type').distinct()
+        # Fetch every pending line in one ordered query; lines of an order arrive together
+        pending_lines = OrderData.objects.filter(sent_status=0).order_by(
+            'order_number', 'transaction_type', 'order_line'
+        ).values_list('id', 'order_number', 'transaction_type', 'order_line', 'item', 'quantity', 'bin_location')
         
-        if pending_orders:
-            logger.info(f"Found {len(pending_orders)} pending orders to process")
-            logger.debug(f"Pending order numbers: {[order['order_number'] for order in pending_orders]}")
+        orders = group_order_lines(pending_lines, warehouse)
+        if orders:
+            logger.info(f"Found {len(orders)} pending orders to process")
+            logger.debug(f"Pending order numbers: {[order_number for order_number, _, _, _ in orders]}")
         else:
             logger.info("No pending orders found")
             return "No orders to process"
@@ -40,99 +190,45 @@ def create_api_orders():
         api_url = f"{api_host}/api/full-order/"
         logger.info(f"API Endpoint: {api_url}")
         
-        for order_group in pending_orders:
-            order_number = order_group['order_number']
-            transaction_type = order_group['transaction_type']
-            
-            # Set order_type based on transaction_type
-            order_type = 4 if transaction_type == 'PICK' else 3  # 4 for PICK, 3 for PUT
-            
-            # Get order lines sorted by order_line to maintain line sequence
-            order_lines = OrderData.objects.filter(
-                order_number=order_number,
-                sent_status=0
-            ).order_by('order_line')
-            
-            # Skip if no lines found
-            if not order_lines:
-                logger.warning(f"No lines found for order {order_number} despite being in pending orders")
-                continue
-                
-            logger.info(f"\nProcessing {transaction_type} order {order_number} with {len(order_lines)} lines")
-            logger.debug(f"Order lines for {order_number}: {list(order_lines.values())}")
-            
-            # Prepare API payload
-            payload = {
-                "name": order_number,
-                "warehouse": warehouse,
-                "order_type": order_type,  # Dynamic based on transaction_type
-                "order_lines": []
-            }
-            
-            # Add order lines using stored order_line number
-            for line in order_lines:
-                order_line = {
-                    "line_number": line.order_line,  # Use the stored order_line value
-                    "item": line.item,
-                    "quantity": line.quantity,
-                    "suggested_bin": line.bin_location if line.bin_location else ""  # Empty string if bin_location is NULL
+        sent_count = 0
+        failed_count = 0
+        
+        # Post orders in parallel over one keep-alive session, queueing a batch at a time.
+        # Statuses are written every API_STATUS_FLUSH_SIZE completed orders, so an
+        # interrupted run re-posts as few accepted orders as possible.
+        with build_session(API_ORDER_CONCURRENCY) as session, \
+                ThreadPoolExecutor(max_workers=API_ORDER_CONCURRENCY) as executor:
+            for batch in chunked(orders, API_ORDER_BATCH_SIZE):
+                futures = {
+                    executor.submit(send_order, session, api_url, order_number, transaction_type, payload):
+                        (order_number, transaction_type, line_ids)
+                    for order_number, transaction_type, line_ids, payload in batch
                 }
-                payload["order_lines"].append(order_line)
-                logger.debug(f"Added line {line.order_line} to payload: {order_line}")
-            
-            # Log the full payload
-            logger.info(f"Request Payload for {transaction_type} order {order_number}:")
-            logger.debug(json.dumps(payload, indent=2))
-                
-            try:
-                # Make API request with timeout
-                logger.info(f"Sending request to API for {transaction_type} order {order_number}")
-                logger.debug(f"Request URL: {api_url}")
-                logger.debug(f"Request Headers: {{'Content-Type': 'application/json'}}")
-                
-                response = requests.post(
-                    api_url, 
-                    json=payload, 
-                    timeout=30,  # 30 seconds timeout
-                    headers={'Content-Type': 'application/json'}
-                )
-                
-                # Log response details
-                logger.info(f"Response Status Code: {response.status_code}")
-                logger.debug(f"Response Headers: {dict(response.headers)}")
                 
+                sent_line_ids = []
+                failed_line_ids = defaultdict(list)
                 try:
-                    response_json = response.json()
-                    logger.debug(f"Response Body: {json.dumps(response_json, indent=2)}")
-                except json.JSONDecodeError:
-                    logger.warning(f"Response not JSON. Text: {response.text[:500]}")
-                
-                response.raise_for_status()
-                
-                # Update status to success
-                order_lines.update(sent_status=1)
-                logger.info(f"Successfully processed {transaction_type} order {order_number}")
-                logger.debug(f"Updated {len(order_lines)} lines to sent_status=1")
-                
-            except requests.exceptions.Timeout:
-                error_message = f"Timeout while connecting to API for {transaction_type} order {order_number}"
-                logger.error(error_message)
-                logger.debug(f"Request timed out after 30 seconds")
-                order_lines.update(sent_status=99, api_error=error_message)
-                
-            except requests.exceptions.ConnectionError as e:
-                error_message = f"Connection error for {transaction_type} order {order_number}: {str(e)}"
-                logger.error(error_message)
-                logger.debug(f"Connection Details: Host={api_host}")
-                logger.exception("Full connection error traceback:")
-                order_lines.update(sent_status=99, api_error=error_message)
-                
-            except requests.exceptions.RequestException as e:
-                error_message = f"API error for {transaction_type} order {order_number}: {str(e)}"
-                logger.error(error_message)
-                logger.exception("Full API error traceback:")
-                order_lines.update(sent_status=99, api_error=error_message)
-                
+                    for completed, future in enumerate(as_completed(futures), start=1):
+                        order_number, transaction_type, line_ids = futures[future]
+                        sent_status, error_message = future.result()
+                        if sent_status == 1:
+                            sent_line_ids.extend(line_ids)
+                            sent_count += 1
+                            logger.info(f"Successfully processed {transaction_type} order {order_number}")
+                        else:
+                            failed_line_ids[error_message].extend(line_ids)
+                            failed_count += 1
+                        
+                        if completed % API_STATUS_FLUSH_SIZE == 0:
+                            write_statuses(sent_line_ids, failed_line_ids)
+                            sent_line_ids = []
+                            failed_line_ids = defaultdict(list)
+                finally:
+                    # Record whatever completed, even if the batch was cut short
+                    write_statuses(sent_line_ids, failed_line_ids)
+        
+        logger.info(f"Dispatched {len(orders)} orders: {sent_count} sent, {failed_count} failed")
+        
     except Exception as e:
         logger.error(f"Critical error in create_api_orders task: {str(e)}")
         logger.exception("Full traceback:")
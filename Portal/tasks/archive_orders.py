@@ -0,0 +1,114 @@
+import os
+import logging
+from datetime import timedelta
+from celery import shared_task
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from ..models import OrderData, OrderDataArchive
+from ..utils.locks import single_instance
+from ..utils.kpis import invalidate_order_kpis
+from ..utils.events import publish_order_update
+
+# Set up logger
+logger = logging.getLogger('order_archive')
+
+# Exported lines older than this many days are moved to the archive table
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', '30'))
+
+# Lines moved per transaction, and the most batches one run will move
+ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', '1000'))
+ARCHIVE_MAX_BATCHES = int(os.getenv('ARCHIVE_MAX_BATCHES', '50'))
+
+# Fields copied from the live table into the archive
+ARCHIVED_FIELDS = [
+    'order_number', 'transaction_type', 'item', 'quantity', 'actual_qty', 'processed_at',
+    'file_name', 'sent_status', 'api_error', 'user', 'wms_location', 'bin_location',
+    'order_line', 'inserted_date', 'shortage_qty',
+]
+
+
+def archive_batch(cutoff, after_id, batch_size=ARCHIVE_BATCH_SIZE):
+    """
+    Move one batch of exported lines older than `cutoff` into OrderDataArchive.
+
+    The copy and the delete run in one transaction, so a line is never in both
+    tables or in neither.
+
+    Returns:
+        tuple: (lines moved, id of the last line moved or None when nothing was left)
+    """
+    with transaction.atomic():
+        lines = list(
+            OrderData.objects.filter(
+                Q(inserted_date__lt=cutoff) | Q(inserted_date__isnull=True, processed_at__lt=cutoff),
+                sent_status=4,
+                id__gt=after_id,
+            ).order_by('id').select_for_update()[:batch_size]
+        )
+        if not lines:
+            return 0, None
+
+        OrderDataArchive.objects.bulk_create([
+            OrderDataArchive(original_id=line.id, **{field: getattr(line, field) for field in ARCHIVED_FIELDS})
+            for line in lines
+        ])
+        OrderData.objects.filter(id__in=[line.id for line in lines]).delete()
+        invalidate_order_kpis()
+        publish_order_update('archive_exported_orders', archived=len(lines))
+    return len(lines), lines[-1].id
+
+
+@shared_task(name='Portal.tasks.archive_orders.archive_exported_orders')
+@single_instance()
+def archive_exported_orders():
+    """
+    Task to move exported order lines (status=4) older than ARCHIVE_AFTER_DAYS
+    out of OrderData into OrderDataArchive, so the live table only holds work in flight.
+    Moves at most ARCHIVE_MAX_BATCHES batches of ARCHIVE_BATCH_SIZE lines per run;
+    anything left over is picked up by the next run.
+    """
+    logger.info("="*80)
+    logger.info("Starting order archive task")
+
+    try:
+        cutoff = timezone.now() - timedelta(days=ARCHIVE_AFTER_DAYS)
+        logger.info(f"Archiving exported order lines imported before {cutoff}")
+
+        archived_count = 0
+        after_id = 0
+        for _ in range(ARCHIVE_MAX_BATCHES):
+            moved, after_id = archive_batch(cutoff, after_id)
+            if not moved:
+                break
+            archived_count += moved
+            logger.info(f"Archived {archived_count} order lines so far")
+        else:
+            logger.info(f"Stopped after {ARCHIVE_MAX_BATCHES} batches; the rest will be archived next run")
+
+        logger.info(f"Archive completed. Archived {archived_count} order lines")
+        logger.info("="*80)
+        return f"Archived {archived_count} order lines"
+
+    except Exception as e:
+        logger.error(f"Error in archive_exported_orders task: {str(e)}")
+        logger.exception("Full traceback:")
+        return f"Error: {str(e)}"
+
+
+def order_history(order_number):
+    """
+    Return every line of an order, whether it is still live or already archived.
+
+    Returns:
+        list: Line dicts ordered by order line, each with an 'archived' flag
+    """
+    fields = ['id'] + ARCHIVED_FIELDS
+    live = OrderData.objects.filter(order_number=order_number).values(*fields)
+    archived = OrderDataArchive.objects.filter(order_number=order_number).values('original_id', 'archived_at', *ARCHIVED_FIELDS)
+
+    lines = [dict(line, archived=False) for line in live]
+    for line in archived:
+        line['id'] = line.pop('original_id')
+        lines.append(dict(line, archived=True))
+    return sorted(lines, key=lambda line: (line['order_line'] is None, line['order_line'] or 0))
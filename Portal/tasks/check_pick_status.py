@@ -1,165 +1,311 @@
 import os
+import time
 import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from celery import shared_task
-from Portal.models import OrderData
+from Portal.models import OrderData, TaskConfig
 from dotenv import load_dotenv
 from Portal.utils.logger import general_logger as logger
+from Portal.utils.http import build_session
+from Portal.utils.ratelimit import AdaptiveTokenBucket
+from Portal.utils.locks import single_instance
+from Portal.utils.kpis import invalidate_order_kpis
+from Portal.utils.events import publish_order_update
 from collections import defaultdict
 from datetime import datetime, timedelta
+from itertools import groupby
 
 load_dotenv()
 
 # Number of days to wait before marking status 99 records as complete
 TIMEOUT_DAYS = 1  # Adjust this value as needed
 
+# Query parameter the history API accepts to return only records newer than an id
+# (e.g. "id__gt"). Leave unset if the API does not support it. The full history of
+# every open order is then downloaded on every run and only compared against the
+# stored cursor here, so set it wherever the API allows: without it each run costs
+# one full history download per open order, however little has changed.
+HISTORY_SINCE_PARAM = os.getenv('HISTORY_SINCE_PARAM', '')
+
+# Maximum number of history requests in flight at once
+PICK_STATUS_CONCURRENCY = int(os.getenv('PICK_STATUS_CONCURRENCY', '8'))
+
+# Requests per second allowed against the controller, and the average response
+# time above which the rate is backed off
+PICK_STATUS_RATE = float(os.getenv('PICK_STATUS_RATE', '20'))
+PICK_STATUS_LATENCY_TARGET = float(os.getenv('PICK_STATUS_LATENCY_TARGET', '1.0'))
+
+# Fields written back for each checked line
+LINE_UPDATE_FIELDS = ['actual_qty', 'shortage_qty', 'sent_status', 'last_history_id']
+
+# Fields the new values are worked out from; a line is only written while these
+# still hold the values read before its history was fetched
+LINE_GUARD_FIELDS = ['quantity', 'actual_qty', 'shortage_qty', 'sent_status', 'last_history_id']
+
+
+def fetch_history(session, limiter, api_url, params):
+    """
+    Fetch history records for one order. Runs on a worker thread.
+
+    Returns:
+        tuple: (history records or None, response time in seconds, error message or None)
+    """
+    limiter.acquire()
+    started = time.monotonic()
+    try:
+        response = session.get(api_url, params=params, timeout=30)
+        response.raise_for_status()
+        history_data, error = response.json(), None
+    except (requests.exceptions.RequestException, ValueError) as e:
+        history_data, error = None, str(e)
+    latency = time.monotonic() - started
+    limiter.record_latency(latency)
+    return history_data, latency, error
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers, 0 for an empty list"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def aggregate_history(records, transaction_type):
+    """
+    Sum confirmed quantities and keep the latest shortage per (item, line number).
+
+    Returns:
+        dict: Maps (item_name, line_number) to {'confirmed', 'shortage', 'latest_shortage_id'}
+    """
+    # Dictionary to store quantities by item and line number
+    line_data = defaultdict(lambda: {'confirmed': 0, 'shortage': 0, 'latest_shortage_id': 0})
+    expected_order_type = 4 if transaction_type == 'PICK' else 3
+
+    # Process each history record
+    for record in records:
+        order_type = record.get('order_type')
+        history_type = record.get('history_type')
+
+        # Skip records that don't match our order type or aren't confirmed/shortage
+        if order_type != expected_order_type or history_type not in [1, 5]:
+            logger.debug(f"Skipping record with mismatched order_type: {order_type} (expected {expected_order_type}) or history_type: {history_type}")
+            continue
+
+        item_name = record.get('item_name')
+        line_number = record.get('order_line_number')
+        record_id = record.get('id', 0)
+
+        if item_name and line_number is not None:
+            line_key = (item_name, line_number)
+            if history_type == 1:
+                # For confirmed picks - sum up the quantities
+                line_data[line_key]['confirmed'] += record.get('quantity_confirmed', 0)
+            elif history_type == 5:
+                # For shortages - take the most recent one
+                if record_id > line_data[line_key]['latest_shortage_id']:
+                    line_data[line_key]['shortage'] = record.get('quantity_requested', 0)
+                    line_data[line_key]['latest_shortage_id'] = record_id
+
+    return line_data
+
+
+def snapshot_lines(lines):
+    """Record the guard field values of each line, before its history is applied"""
+    return {line.pk: {field: getattr(line, field) for field in LINE_GUARD_FIELDS} for line in lines}
+
+
+def write_checked_lines(lines, snapshot):
+    """
+    Write back the lines whose values changed, unless something else changed them first.
+
+    The history fetch is slow, and an import, a reset or the API sender may update
+    a line meanwhile. Each UPDATE only matches while the line still holds the values
+    it was read with, so those changes are never overwritten; the skipped line keeps
+    its old cursor and is checked again on the next run.
+
+    Returns:
+        tuple: (list of the lines written, number skipped because they changed meanwhile)
+    """
+    written = []
+    stale = 0
+    for line in lines:
+        before = snapshot[line.pk]
+        changes = {field: getattr(line, field) for field in LINE_UPDATE_FIELDS if getattr(line, field) != before[field]}
+        if not changes:
+            continue
+        if OrderData.objects.filter(pk=line.pk, **before).update(**changes):
+            written.append(line)
+        else:
+            stale += 1
+            logger.info(f"Order {line.order_number} Line {line.order_line} changed while its history was fetched; "
+                        f"checking it again next run")
+    return written, stale
+
+
+def apply_history(lines, line_data, incremental, newest_id):
+    """
+    Update order line instances in memory from aggregated history.
+
+    In incremental mode line_data only covers records newer than the stored cursor,
+    so confirmed quantities are added to the stored actual_qty and a shortage is only
+    replaced when a newer one arrived. Otherwise line_data covers the full history.
+    """
+    for line in lines:
+        line.last_history_id = newest_id
+        quantities = line_data.get((line.item, line.order_line))
+        if quantities is None:
+            continue
+
+        if incremental:
+            confirmed = (line.actual_qty or 0) + quantities['confirmed']
+            shortage = quantities['shortage'] if quantities['latest_shortage_id'] else (line.shortage_qty or 0)
+        else:
+            confirmed = quantities['confirmed']
+            shortage = quantities['shortage']
+
+        line.actual_qty = confirmed
+        line.shortage_qty = shortage
+
+        # Determine status based on confirmed and shortage quantities
+        if confirmed == line.quantity:
+            # Quantities match exactly
+            line.sent_status = 3
+            logger.info(f"Order {line.order_number} Line {line.order_line} completed - exact match: requested={line.quantity}, confirmed={confirmed}")
+        elif shortage > 0:
+            # Have shortage record - mark as complete
+            line.sent_status = 3
+            logger.info(f"Order {line.order_number} Line {line.order_line} completed with shortage: confirmed={confirmed}, shortage={shortage}")
+        else:
+            # Still processing
+            line.sent_status = 99
+            logger.debug(f"Order {line.order_number} Line {line.order_line} still processing: requested={line.quantity}, confirmed={confirmed}")
+
+
 @shared_task(name='Portal.tasks.check_pick_status')
+@single_instance(name='Portal.tasks.check_pick_status')
 def check_pick_status():
     """
     Task to check pick status from API for orders that have been sent (status=1)
     Updates actual_qty, shortage_qty and status based on confirmed/shortage quantities
     Handles both PUT (order_type=3) and PICK (order_type=4) orders
     Also handles timeout for records stuck in status 99
+    Orders whose history has not changed since the last check are skipped
+    History requests run in parallel, rate limited by PICK_STATUS_RATE
     """
     logger.info("="*80)
     logger.info("Starting pick status check task")
+    started = time.monotonic()
     
     try:
         # Calculate the timeout date
         timeout_date = datetime.now() - timedelta(days=TIMEOUT_DAYS)
         
         # First, handle timeout for status 99 records
-        timeout_orders = OrderData.objects.filter(
+        timed_out = OrderData.objects.filter(
             sent_status=99,
             inserted_date__lt=timeout_date
+        ).update(sent_status=3)
+
+        if timed_out:
+            logger.info(f"Updated {timed_out} orders that timed out after {TIMEOUT_DAYS} days to status 3")
+
+        # Get all lines with sent_status=1 or 99 (sent but not yet picked) in one query
+        open_lines = OrderData.objects.filter(
+            sent_status__in=[1, 99],
+            inserted_date__gte=timeout_date  # Only check orders within the timeout period
+        ).order_by('order_number', 'transaction_type', 'order_line').only(
+            'id', 'order_number', 'transaction_type', 'item', 'order_line', 'quantity',
+            'actual_qty', 'shortage_qty', 'sent_status', 'last_history_id'
         )
         
-        if timeout_orders.exists():
-            logger.info(f"Found {timeout_orders.count()} orders that have timed out after {TIMEOUT_DAYS} days")
-            timeout_orders.update(sent_status=3)
-            logger.info("Updated timed out orders to status 3")
+        api_host = os.getenv('API_HOST', '').rstrip('/')
+        api_url = f"{api_host}/api/history/"
         
-        # Get all orders with sent_status=1 or 99 (sent but not yet picked)
-        sent_orders = OrderData.objects.filter(
-            sent_status__in=[1, 99],
-            inserted_date__gte=timeout_date  # Only check orders within the timeout period
-        ).values('order_number', 'transaction_type').distinct()
+        # Group the open lines per order and work out where each order's history stands
+        orders = []
+        for (order_number, transaction_type), lines in groupby(open_lines, key=lambda line: (line.order_number, line.transaction_type)):
+            lines = list(lines)
+            
+            # Lines without a cursor (never checked) force a full read of the order history
+            cursor = min(line.last_history_id or 0 for line in lines)
+            incremental = bool(HISTORY_SINCE_PARAM) and cursor > 0
+            
+            params = {'order_name': order_number}
+            if incremental:
+                params[HISTORY_SINCE_PARAM] = cursor
+            orders.append((order_number, transaction_type, lines, cursor, incremental, params))
         
-        if not sent_orders:
+        if not orders:
             logger.info("No sent orders found to check")
             return "No orders to check"
-            
-        api_host = os.getenv('API_HOST', '').rstrip('/')
+        if not HISTORY_SINCE_PARAM:
+            logger.info(f"HISTORY_SINCE_PARAM is not set; downloading the full history of all {len(orders)} open orders")
         
-        for order_group in sent_orders:
-            order_number = order_group['order_number']
-            transaction_type = order_group['transaction_type']
-            logger.info(f"Checking status for {transaction_type} order: {order_number}")
+        changed_count = 0
+        stale_count = 0
+        completed_lines = 0
+        error_count = 0
+        latencies = []
+        limiter = AdaptiveTokenBucket(PICK_STATUS_RATE, PICK_STATUS_LATENCY_TARGET, min_rate=1.0)
+        
+        # Fan the history requests out over a bounded pool sharing one keep-alive session;
+        # results are applied on this thread so database writes stay on one connection
+        with build_session(PICK_STATUS_CONCURRENCY) as session, \
+                ThreadPoolExecutor(max_workers=PICK_STATUS_CONCURRENCY) as executor:
+            futures = {
+                executor.submit(fetch_history, session, limiter, api_url, params): (order_number, transaction_type, lines, cursor, incremental)
+                for order_number, transaction_type, lines, cursor, incremental, params in orders
+            }
             
-            try:
-                # Make API request
-                api_url = f"{api_host}/api/history/?order_name={order_number}"
-                logger.info(f"Making API request to: {api_url}")
-                response = requests.get(api_url, timeout=30)
-                response.raise_for_status()
-                history_data = response.json()
+            for future in as_completed(futures):
+                order_number, transaction_type, lines, cursor, incremental = futures[future]
+                history_data, latency, error = future.result()
+                latencies.append(latency)
                 
-                if not history_data:
-                    logger.info(f"No history data found for order {order_number}")
+                if error:
+                    error_count += 1
+                    logger.error(f"API error checking status for {transaction_type} order {order_number}: {error}")
                     continue
                 
-                logger.info(f"Received {len(history_data)} history records for order {order_number}")
+                # Skip orders whose history has not moved since the last check
+                newest_id = max((record.get('id', 0) for record in history_data), default=0)
+                if newest_id <= cursor:
+                    logger.debug(f"No new history for {transaction_type} order {order_number}")
+                    continue
                 
-                # Dictionary to store quantities by item and line number
-                line_data = defaultdict(lambda: {'confirmed': 0, 'shortage': 0, 'latest_shortage_id': 0})
+                if incremental:
+                    history_data = [record for record in history_data if record.get('id', 0) > cursor]
                 
-                # Process each history record
-                for record in history_data:
-                    order_type = record.get('order_type')
-                    history_type = record.get('history_type')
-                    expected_order_type = 4 if transaction_type == 'PICK' else 3
-                    
-                    # Skip records that don't match our order type or aren't confirmed/shortage
-                    if order_type != expected_order_type or history_type not in [1, 5]:
-                        logger.debug(f"Skipping record with mismatched order_type: {order_type} (expected {expected_order_type}) or history_type: {history_type}")
-                        continue
-                        
-                    item_name = record.get('item_name')
-                    line_number = record.get('order_line_number')
-                    record_id = record.get('id', 0)
-                    
-                    if item_name and line_number is not None:
-                        line_key = (item_name, line_number)
-                        if history_type == 1:
-                            # For confirmed picks - sum up the quantities
-                            quantity_confirmed = record.get('quantity_confirmed', 0)
-                            line_data[line_key]['confirmed'] += quantity_confirmed
-                            logger.info(f"Added confirmed quantity {quantity_confirmed} for {item_name} (Line {line_number}), total now: {line_data[line_key]['confirmed']}")
-                        elif history_type == 5:
-                            # For shortages - take the most recent one
-                            if record_id > line_data[line_key]['latest_shortage_id']:
-                                shortage_qty = record.get('quantity_requested', 0)
-                                line_data[line_key]['shortage'] = shortage_qty
-                                line_data[line_key]['latest_shortage_id'] = record_id
-                                logger.info(f"Updated shortage quantity to {shortage_qty} for {item_name} (Line {line_number}) from record {record_id}")
+                logger.info(f"Received {len(history_data)} {'new ' if incremental else ''}history records for {transaction_type} order {order_number}")
                 
-                # Update each item line with its quantities
-                for (item_name, line_number), quantities in line_data.items():
-                    logger.info(f"Processing {transaction_type} order {order_number}, {item_name}, Line {line_number}")
-                    logger.info(f"Final quantities - Total Confirmed: {quantities['confirmed']}, Latest Shortage: {quantities['shortage']}")
-                    
-                    # Get the specific order line
-                    order_line = OrderData.objects.filter(
-                        order_number=order_number,
-                        item=item_name,
-                        order_line=line_number,
-                        transaction_type=transaction_type,
-                        sent_status__in=[1, 99]
-                    ).first()
-                    
-                    if not order_line:
-                        logger.warning(f"No matching order found for {transaction_type} order {order_number}, item {item_name}, Line {line_number}")
-                        continue
-                    
-                    # Update data based on quantities
-                    update_data = {
-                        'actual_qty': quantities['confirmed'],
-                        'shortage_qty': quantities['shortage']
-                    }
-                    
-                    # Determine status based on confirmed and shortage quantities
-                    if quantities['confirmed'] == order_line.quantity:
-                        # Quantities match exactly
-                        update_data['sent_status'] = 3
-                        logger.info(f"Order completed - exact match: requested={order_line.quantity}, confirmed={quantities['confirmed']}")
-                    elif quantities['shortage'] > 0:
-                        # Have shortage record - mark as complete
-                        update_data['sent_status'] = 3
-                        logger.info(f"Order completed with shortage: confirmed={quantities['confirmed']}, shortage={quantities['shortage']}")
-                    else:
-                        # Still processing
-                        update_data['sent_status'] = 99
-                        logger.info(f"Order still processing: requested={order_line.quantity}, confirmed={quantities['confirmed']}")
-                    
-                    # Update the specific order line
-                    updated = OrderData.objects.filter(
-                        order_number=order_number,
-                        item=item_name,
-                        order_line=line_number,
-                        transaction_type=transaction_type,
-                        sent_status__in=[1, 99]
-                    ).update(**update_data)
-                    
-                    if updated:
-                        logger.info(f"Updated {transaction_type} order {order_number}, Line {line_number}: "
-                                  f"actual_qty={update_data['actual_qty']}, "
-                                  f"shortage_qty={update_data['shortage_qty']}, "
-                                  f"status={update_data['sent_status']}")
-                    else:
-                        logger.warning(f"Failed to update {transaction_type} order {order_number}, Line {line_number}")
+                line_data = aggregate_history(history_data, transaction_type)
+                unmatched = set(line_data) - {(line.item, line.order_line) for line in lines}
+                if unmatched:
+                    logger.warning(f"No matching open lines for {transaction_type} order {order_number}: {sorted(unmatched)}")
                 
-            except requests.exceptions.RequestException as e:
-                logger.error(f"API error checking status for {transaction_type} order {order_number}: {str(e)}")
-                continue
+                snapshot = snapshot_lines(lines)
+                apply_history(lines, line_data, incremental, newest_id)
+                written, stale = write_checked_lines(lines, snapshot)
+                changed_count += 1
+                stale_count += stale
+                completed_lines += sum(1 for line in written if line.sent_status == 3 and snapshot[line.pk]['sent_status'] != 3)
+        
+        if timed_out or changed_count:
+            invalidate_order_kpis()
+            publish_order_update('check_pick_status', complete=completed_lines, timed_out=timed_out)
+
+        # Per-run metrics for sizing concurrency against the beat interval
+        elapsed = time.monotonic() - started
+        frequency = TaskConfig.objects.filter(task_name='Portal.tasks.check_pick_status').values_list('frequency', flat=True).first()
+        budget_used = f"{elapsed / frequency:.0%} of {frequency}s interval" if frequency else "no interval configured"
+        metrics = (f"{len(orders)} orders checked, {changed_count} changed, {stale_count} lines changed meanwhile, {error_count} errors, "
+                   f"latency p50={percentile(latencies, 0.5):.3f}s p95={percentile(latencies, 0.95):.3f}s, "
+                   f"final rate {limiter.rate:.1f}/s, took {elapsed:.1f}s ({budget_used})")
+        logger.info(f"Pick status metrics: {metrics}")
+        
+        logger.info("="*80)
+        return f"Status check completed: {metrics}"
                 
     except Exception as e:
         logger.error(f"Error in check_pick_status task: {str(e)}", exc_info=True)
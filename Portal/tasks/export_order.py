@@ -1,108 +1,146 @@
 import os
-import pandas as pd
+from itertools import groupby
+from operator import itemgetter
 from celery import shared_task
+from django.db.models import Count, F, Q
 from Portal.models import OrderData
 from Portal.utils.logger import general_logger as logger
 from ..utils.folder_setup import get_folder_path
+from ..utils.locks import single_instance
+from ..utils.batching import chunked, IN_CLAUSE_BATCH_SIZE
+from ..utils.events import publish_order_update
+from ..utils.exports import EXPORT_FIELDS, EXPORT_HEADERS, XLSX_CELL_OPTIONS, export_row
+
+try:
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
+
+# Orders with more lines than this are streamed to disk (xlsxwriter constant-memory
+# mode); smaller ones are built in memory, which is several times faster per file
+EXPORT_CONSTANT_MEMORY_LINES = int(os.getenv('EXPORT_CONSTANT_MEMORY_LINES', '5000'))
+
+
+def completed_order_numbers():
+    """
+    Find the orders whose every line is complete (status=3), in one grouped query.
+
+    Only orders with at least one complete line are grouped, so the query never
+    counts lines across the whole table.
+
+    Returns:
+        list: (order number, line count) tuples
+    """
+    return list(
+        OrderData.objects.filter(
+            order_number__in=OrderData.objects.filter(sent_status=3).values('order_number')
+        ).values('order_number').annotate(
+            total_lines=Count('id'),
+            complete_lines=Count('id', filter=Q(sent_status=3)),
+        ).filter(total_lines=F('complete_lines')).order_by('order_number').values_list('order_number', 'total_lines')
+    )
+
+
+def write_workbook(path, rows, line_count=0):
+    """
+    Write one order's lines to an .xlsx file, row by row.
+
+    Uses xlsxwriter when installed, in constant-memory mode for orders over
+    EXPORT_CONSTANT_MEMORY_LINES lines, otherwise a write-only openpyxl workbook.
+    """
+    if xlsxwriter is not None:
+        if line_count > EXPORT_CONSTANT_MEMORY_LINES:
+            options = {'constant_memory': True}
+        else:
+            options = {'in_memory': True}
+        workbook = xlsxwriter.Workbook(path, {**options, **XLSX_CELL_OPTIONS, 'default_date_format': 'yyyy-mm-dd hh:mm:ss'})
+        worksheet = workbook.add_worksheet()
+        worksheet.write_row(0, 0, EXPORT_HEADERS)
+        for row_number, row in enumerate(rows, start=1):
+            worksheet.write_row(row_number, 0, row)
+        workbook.close()
+        return
+
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet()
+    worksheet.append(EXPORT_HEADERS)
+    for row in rows:
+        worksheet.append(row)
+    workbook.save(path)
+
 
 @shared_task(name='Portal.tasks.export_order.export_completed_orders')
+@single_instance()
 def export_completed_orders():
     """
     Task to export completed orders (status=3) to Excel files.
     Creates one file per order and updates status to 4 after successful export.
+    Orders are handled in batches: one query fetches the lines of every order in
+    the batch and one UPDATE marks the batch's exported orders.
     """
     logger.info("="*80)
     logger.info("Starting order export task")
-    
+
     try:
         # Get completed orders that haven't been exported yet
-        completed_orders = OrderData.objects.filter(
-            sent_status=3
-        ).values('order_number').distinct()
-        
+        completed_orders = completed_order_numbers()
+
         if not completed_orders:
             logger.info("No completed orders to export")
             return "No orders to export"
-            
+
         export_folder = get_folder_path('export')
         if not export_folder:
             logger.error("Could not get export folder path")
             return "Export folder path not configured"
-            
+
         os.makedirs(export_folder, exist_ok=True)
-        logger.info(f"Exporting to folder: {export_folder}")
-        
+        logger.info(f"Exporting {len(completed_orders)} completed orders to folder: {export_folder}")
+
         exported_count = 0
-        
-        for order in completed_orders:
-            order_number = order['order_number']
-            logger.info(f"Processing order: {order_number}")
-            
-            # Get all lines for this order
-            order_lines = OrderData.objects.filter(
-                order_number=order_number,
+
+        for batch in chunked(completed_orders, IN_CLAUSE_BATCH_SIZE):
+            line_counts = dict(batch)
+            exported = []
+            lines = OrderData.objects.filter(
+                order_number__in=list(line_counts),
                 sent_status=3
-            ).order_by('order_line')
-            
-            # Check if all lines in the order are status 3
-            total_lines = OrderData.objects.filter(
-                order_number=order_number
-            ).count()
-            
-            if order_lines.count() != total_lines:
-                logger.info(f"Skipping order {order_number} - not all lines are complete")
-                continue
-            
-            # Define export filename
-            export_file = os.path.join(export_folder, f"{order_number}.xlsx")
-            
-            # Skip if file already exists
-            if os.path.exists(export_file):
-                logger.info(f"Export already exists for order {order_number}")
-                order_lines.update(sent_status=4)
-                continue
-            
-            # Convert to DataFrame
-            data = []
-            for line in order_lines:
-                data.append({
-                    'Order Number': line.order_number,
-                    'Transaction Type': line.transaction_type,
-                    'Item': line.item,
-                    'Quantity Requested': line.quantity,
-                    'Actual Quantity': line.actual_qty,
-                    'Shortage Quantity': line.shortage_qty,
-                    'WMS Location': line.wms_location,
-                    'Bin Location': line.bin_location,
-                    'Order Line': line.order_line,
-                    'Processed At': line.processed_at,
-                    'File Name': line.file_name,
-                    'User': line.user,
-                    'API Error': line.api_error,
-                })
-            
-            df = pd.DataFrame(data)
-            
-            try:
-                # Export to Excel
-                df.to_excel(export_file, index=False)
-                
-                # Verify file was created
+            ).order_by('order_number', 'order_line').values_list(*EXPORT_FIELDS).iterator(chunk_size=2000)
+
+            for order_number, order_lines in groupby(lines, key=itemgetter(0)):
+                export_file = os.path.join(export_folder, f"{order_number}.xlsx")
+
+                # Skip if file already exists
                 if os.path.exists(export_file):
+                    logger.info(f"Export already exists for order {order_number}")
+                    exported.append(order_number)
+                    continue
+
+                # Write to a temporary name first so a failed write never leaves a partial export
+                temp_file = f"{export_file}.tmp"
+                try:
+                    write_workbook(temp_file, (export_row(line) for line in order_lines), line_counts[order_number])
+                    os.replace(temp_file, export_file)
                     logger.info(f"Exported order {order_number} to {export_file}")
-                    order_lines.update(sent_status=4)
-                    logger.info(f"Updated status to 4 for order {order_number}")
+                    exported.append(order_number)
                     exported_count += 1
-                else:
-                    logger.error(f"Failed to create export file for order {order_number}")
-            except Exception as export_error:
-                logger.error(f"Error exporting order {order_number}: {str(export_error)}")
-                continue
-        
+                except Exception as export_error:
+                    logger.error(f"Error exporting order {order_number}: {str(export_error)}")
+                    if os.path.exists(temp_file):
+                        os.remove(temp_file)
+                    continue
+
+            if exported:
+                exported_lines = OrderData.objects.filter(order_number__in=exported, sent_status=3).update(sent_status=4)
+                logger.info(f"Updated status to 4 for {len(exported)} orders")
+                publish_order_update('export_completed_orders', exported=exported_lines)
+
         logger.info(f"Export completed. Exported {exported_count} orders")
         return f"Exported {exported_count} orders"
-        
+
     except Exception as e:
         logger.error(f"Error in export_completed_orders task: {str(e)}")
         logger.exception("Full traceback:")
-        return f"Error: {str(e)}" 
\ No newline at end of file
+        return f"Error: {str(e)}"
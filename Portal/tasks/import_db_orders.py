@@ -2,9 +2,15 @@ import os
 import logging
 from celery import shared_task
 from django.conf import settings
+from django.db import transaction, InterfaceError, OperationalError
 from django.utils import timezone
 import pytz
 from ..models import OrderData, WarehouseLocation, TaskConfig
+from ..utils.batching import chunked
+from ..utils.locks import single_instance
+from ..utils.kpis import invalidate_order_kpis
+from ..utils.events import publish_order_update
+from .import_order import existing_order_lines
 import pyodbc
 from datetime import datetime, timedelta
 from urllib.parse import urlparse
@@ -12,7 +18,133 @@ from urllib.parse import urlparse
 # Set up logger
 logger = logging.getLogger('db_order_import')
 
+# Number of staged order lines merged per statement
+UPSERT_BATCH_SIZE = int(os.getenv('STAGING_UPSERT_BATCH_SIZE', '1000'))
+
+# Rows fetched from the staging database per round trip
+FETCH_SIZE = int(os.getenv('STAGING_FETCH_SIZE', '5000'))
+
+# Fields refreshed when a staged order line already exists
+UPSERT_UPDATE_FIELDS = [
+    'transaction_type', 'item', 'quantity', 'wms_location', 'bin_location',
+    'sent_status', 'file_name', 'processed_at', 'inserted_date',
+]
+
+
+def upsert_order_lines(orders):
+    """
+    Merge OrderData instances into the table, keyed on (order_number, order_line).
+
+    One lookup query finds the lines that already exist, then bulk_update refreshes
+    them and bulk_create inserts the rest. The unique constraint only covers
+    numbered lines, which rules out INSERT ... ON CONFLICT on its columns.
+    Lines already exported and archived are left alone rather than imported again.
+    Returns the number of order lines merged.
+    """
+    # Keep the last occurrence of each order line so a statement never touches a row twice
+    orders = list({(order.order_number, order.order_line): order for order in orders}.values())
+
+    existing = existing_order_lines({order.order_number for order in orders})
+    new_orders = []
+    changed_orders = []
+    for order in orders:
+        key = (order.order_number, order.order_line)
+        if key not in existing:
+            new_orders.append(order)
+        elif existing[key] is None:
+            logger.info(f"Skipping order {order.order_number} - Line {order.order_line}: already exported and archived")
+        else:
+            order.id = existing[key]
+            changed_orders.append(order)
+
+    OrderData.objects.bulk_create(new_orders)
+    OrderData.objects.bulk_update(changed_orders, UPSERT_UPDATE_FIELDS)
+    return len(new_orders) + len(changed_orders)
+
+
+def advance_high_water_mark(task_config, row):
+    """
+    Record a staged row as the last one imported.
+
+    The (created_at, order_number, order_line) key of the row is stored, so the
+    next fetch resumes after it even when many rows share its timestamp.
+    Returns the row's created_at as an aware datetime.
+    """
+    # Staging timestamps are naive UTC
+    high_water_mark = row[6].replace(tzinfo=pytz.UTC)
+    TaskConfig.objects.filter(pk=task_config.pk).update(
+        high_water_mark=high_water_mark,
+        high_water_order_number=row[0],
+        high_water_order_line=row[5],
+        last_run=timezone.now(),
+    )
+    return high_water_mark
+
+
+def commit_staged_chunk(rows, location_mappings, task_config):
+    """
+    Merge a chunk of staged rows and advance the high-water mark in one transaction.
+
+    Rows must be in staging key order, so the last row is the newest.
+    Returns a tuple of (order lines merged, new high-water mark).
+    """
+    processed_at = timezone.now()
+    merged = 0
+
+    with transaction.atomic():
+        # Merge the chunk in batches, one set-based statement per batch
+        for batch in chunked(rows, UPSERT_BATCH_SIZE):
+            orders = [
+                OrderData(
+                    order_number=order_number,
+                    transaction_type=transaction_type,
+                    item=item,
+                    quantity=quantity,
+                    wms_location=location,
+                    # Look up bin location if WMS location exists
+                    bin_location=location_mappings.get(location) if location else None,
+                    order_line=order_line,
+                    sent_status=0,
+                    file_name='DB Import',
+                    processed_at=processed_at,
+                    inserted_date=created_at,
+                )
+                for order_number, transaction_type, item, quantity, location, order_line, created_at in batch
+            ]
+            merged += upsert_order_lines(orders)
+
+        high_water_mark = advance_high_water_mark(task_config, rows[-1])
+
+    return merged, high_water_mark
+
+
+def merge_rows_individually(rows, location_mappings, task_config):
+    """
+    Merge a chunk that failed as a whole one row at a time.
+
+    Rows that still fail are logged and skipped, and the high-water mark is moved
+    past them, so a single bad staging row cannot hold back the rows after it.
+    Losing the database connection is not a row's fault, so it is raised instead
+    and the next run retries from the last committed row.
+    Returns a tuple of (order lines merged, rows that failed).
+    """
+    merged = 0
+    errors = 0
+    for row in rows:
+        try:
+            merged += commit_staged_chunk([row], location_mappings, task_config)[0]
+        except (InterfaceError, OperationalError):
+            raise
+        except Exception as e:
+            errors += 1
+            logger.error(f"Error processing order {row[0]} - Line {row[5]}: {str(e)}")
+            logger.exception("Full traceback:")
+    advance_high_water_mark(task_config, rows[-1])
+    return merged, errors
+
+
 @shared_task(name='Portal.tasks.import_db_orders.process_staging_orders')
+@single_instance()
 def process_staging_orders():
     """Process orders from the staging database"""
     try:
@@ -22,16 +154,20 @@ def process_staging_orders():
         # Get task configuration
         task_config = TaskConfig.objects.get(task_name='Portal.tasks.import_db_orders.process_staging_orders')
         
-        # Update last_run before processing to prevent missing orders during long runs
+        # Resume after the last committed row. Deployments without a high-water mark
+        # yet continue from last_run, which used to serve that purpose.
         current_time = timezone.now()
-        last_run = task_config.last_run or datetime(2000, 1, 1, tzinfo=pytz.UTC)
+        high_water_mark = task_config.high_water_mark or task_config.last_run or datetime(2000, 1, 1, tzinfo=pytz.UTC)
         
-        # Convert last_run to naive UTC for SQL Server comparison
-        last_run_naive = last_run.astimezone(pytz.UTC).replace(tzinfo=None)
+        # Convert the high-water mark to naive UTC for SQL Server comparison
+        last_run_naive = high_water_mark.astimezone(pytz.UTC).replace(tzinfo=None)
         
-        task_config.last_run = current_time
-        task_config.next_run = current_time + timedelta(seconds=task_config.frequency)
-        task_config.save()
+        # last_run is only written here once the high-water mark has taken over from it;
+        # before that it moves with each committed chunk, so a failed run skips nothing
+        schedule = {'next_run': current_time + timedelta(seconds=task_config.frequency)}
+        if task_config.high_water_mark is not None:
+            schedule['last_run'] = current_time
+        TaskConfig.objects.filter(pk=task_config.pk).update(**schedule)
         
         logger.info(f"Processing orders created after: {last_run_naive}")
 
@@ -72,7 +208,24 @@ def process_staging_orders():
             order_line_col = os.getenv('STAGING_ORDER_LINE_COL', 'order_line')
             created_at_col = os.getenv('STAGING_CREATED_AT_COL', 'created_at')
 
-            # Query for new orders
+            # Rows after the last one imported, ordered by the same key the high-water
+            # mark records. A mark saved without the key covers every row at its timestamp.
+            created_at = f"CAST({created_at_col} AS datetime2)"
+            order_line = f"COALESCE({order_line_col}, -1)"
+            if task_config.high_water_mark is not None and task_config.high_water_order_number is not None:
+                after_last_row = (
+                    f"({created_at} > ? OR ({created_at} = ? AND ({order_number_col} > ? "
+                    f"OR ({order_number_col} = ? AND {order_line} > ?))))"
+                )
+                params = (
+                    last_run_naive, last_run_naive,
+                    task_config.high_water_order_number, task_config.high_water_order_number,
+                    -1 if task_config.high_water_order_line is None else task_config.high_water_order_line,
+                )
+            else:
+                after_last_row = f"{created_at} > ?"
+                params = (last_run_naive,)
+
             query = f"""
                 SELECT 
                     {order_number_col},
@@ -81,68 +234,48 @@ def process_staging_orders():
                     {quantity_col},
                     {location_col},
                     {order_line_col},
-                    CAST({created_at_col} AS datetime2) as {created_at_col}
+                    {created_at} as {created_at_col}
                 FROM {table_name}
-                WHERE CAST({created_at_col} AS datetime2) > ?
-                ORDER BY {order_number_col}, {order_line_col}
+                WHERE {after_last_row}
+                ORDER BY {created_at}, {order_number_col}, {order_line}
             """
             
-            cursor.execute(query, (last_run_naive,))
-            rows = cursor.fetchall()
-            
-            if not rows:
-                logger.info("No new orders found in staging database")
-                return "No new orders to process"
-
-            logger.info(f"Found {len(rows)} new orders to process")
+            cursor.arraysize = FETCH_SIZE
+            cursor.execute(query, params)
 
             # Get warehouse location mappings
-            location_mappings = {
-                loc.wms_location: loc.cn_bin 
-                for loc in WarehouseLocation.objects.all()
-            }
+            location_mappings = dict(WarehouseLocation.objects.values_list('wms_location', 'cn_bin'))
 
             processed_count = 0
             error_count = 0
+            chunk_count = 0
+
+            # Stream the delta in bounded chunks, committing each one before fetching the next
+            while True:
+                rows = cursor.fetchmany(FETCH_SIZE)
+                if not rows:
+                    break
 
-            # Process each order
-            for row in rows:
                 try:
-                    order_number, transaction_type, item, quantity, location, order_line, created_at = row
-                    
-                    # Look up bin location if WMS location exists
-                    bin_location = location_mappings.get(location) if location else None
-                    
-                    # Create order record
-                    order_data = {
-                        'order_number': order_number,
-                        'transaction_type': transaction_type,
-                        'item': item,
-                        'quantity': quantity,
-                        'wms_location': location,
-                        'bin_location': bin_location,
-                        'order_line': order_line,
-                        'sent_status': 0,
-                        'file_name': 'DB Import',
-                        'processed_at': timezone.now(),
-                        'inserted_date': created_at
-                    }
-                    
-                    # Create or update order
-                    OrderData.objects.update_or_create(
-                        order_number=order_number,
-                        order_line=order_line,
-                        defaults=order_data
-                    )
-                    
-                    processed_count += 1
-                    logger.info(f"Processed order: {order_number} - Line {order_line}")
-                    
+                    merged = commit_staged_chunk(rows, location_mappings, task_config)[0]
                 except Exception as e:
-                    error_count += 1
-                    logger.error(f"Error processing order {order_number} - Line {order_line}: {str(e)}")
-                    logger.exception("Full traceback:")
-            
+                    logger.warning(f"Error merging chunk of {len(rows)} order lines "
+                                   f"({rows[0][0]} - Line {rows[0][5]} to {rows[-1][0]} - Line {rows[-1][5]}): {str(e)}; "
+                                   f"retrying its rows one at a time")
+                    merged, errors = merge_rows_individually(rows, location_mappings, task_config)
+                    error_count += errors
+
+                processed_count += merged
+                chunk_count += 1
+                invalidate_order_kpis()
+                publish_order_update('process_staging_orders', imported=merged)
+                logger.info(f"Committed chunk {chunk_count}: {processed_count} order lines merged, "
+                            f"imported up to {rows[-1][0]} - Line {rows[-1][5]} at {rows[-1][6]}")
+
+            if not processed_count and not error_count:
+                logger.info("No new orders found in staging database")
+                return "No new orders to process"
+
             logger.info(f"Task completed. Processed {processed_count} orders with {error_count} errors")
             return f"Processed {processed_count} orders with {error_count} errors"
 
@@ -1,105 +1,243 @@
 import os
 import pandas as pd
-from celery import shared_task
+from celery import shared_task, group
 from django.conf import settings
+from django.db import transaction
 from ..models import MasterInventory
+from ..utils.locks import single_instance
+from ..utils.events import publish_inventory_update
+from ..utils.ingest_ledger import (
+    DuplicateFileError, file_digest, find_imported, record_duplicate, start_ingest, finish_ingest, record_failure
+)
+from ..utils.readers import read_table, clean_text, INVENTORY_COLUMNS
+from ..utils.batching import chunked, IN_CLAUSE_BATCH_SIZE
+from ..utils.folder_setup import get_folder_path
+from ..utils.watcher import stable_files
+from ..utils.file_claims import claim_file, claim_heartbeat, finish_claim, original_name, recover_stale_claims
 import logging
 from datetime import datetime
 
 # Set up logger
 logger = logging.getLogger('inventory_import')
 
+# Columns every inventory file must provide (after lowercasing)
+REQUIRED_COLUMNS = ['item', 'description', 'uom']
+
+# Item fields taken from the file; a row only counts as changed if one of these differs
+INVENTORY_FIELDS = ['description', 'uom', 'cus1', 'cus2', 'cus3']
+
+# Number of rows sent to the database per INSERT/UPDATE statement
+INVENTORY_BATCH_SIZE = int(os.getenv('INVENTORY_IMPORT_BATCH_SIZE', '1000'))
+
+
+def normalize_inventory_frame(df):
+    """
+    Clean an inventory DataFrame and key it by item.
+
+    Text is stripped with blanks as None. Rows missing a mandatory value or with
+    a value too long for its column are reported instead of failing the file.
+    When an item appears more than once the last row wins, as it did when rows
+    were saved one by one.
+
+    Returns:
+        tuple: (dict mapping item to a tuple of INVENTORY_FIELDS values,
+                list of (row index, error message) tuples)
+    """
+    missing_columns = [column for column in REQUIRED_COLUMNS if column not in df.columns]
+    if missing_columns:
+        raise KeyError(f"Missing required columns {missing_columns}. Available columns: {list(df.columns)}")
+
+    columns = {'item': clean_text(df['item'])}
+    for field in INVENTORY_FIELDS:
+        if field in df.columns:
+            columns[field] = clean_text(df[field])
+        else:
+            columns[field] = pd.Series([None] * len(df), index=df.index, dtype=object)
+
+    checks = [(columns[field].isna(), f"missing {field}") for field in REQUIRED_COLUMNS]
+    for field, values in columns.items():
+        max_length = MasterInventory._meta.get_field(field).max_length
+        lengths = values.where(values.notna(), '').astype(str).str.len()
+        checks.append((lengths > max_length, f"{field} longer than {max_length} characters"))
+
+    invalid = pd.Series(False, index=df.index)
+    errors = []
+    for mask, message in checks:
+        for index in mask[mask & ~invalid].index:
+            errors.append((index, message))
+        invalid |= mask
+
+    valid = ~invalid
+    records = {}
+    for item, *values in zip(columns['item'][valid], *(columns[field][valid] for field in INVENTORY_FIELDS)):
+        records[item] = tuple(values)
+    return records, sorted(errors)
+
+
+def upsert_inventory(records):
+    """
+    Insert new items and update only the items whose fields changed.
+
+    New and changed items get status 0 so api_inventory_creation pushes them;
+    unchanged items keep their current status and are not written at all.
+    Must be called inside a transaction.
+
+    Returns:
+        tuple: (created, updated, unchanged)
+    """
+    existing = {}
+    for batch in chunked(records, IN_CLAUSE_BATCH_SIZE):
+        rows = MasterInventory.objects.filter(item__in=batch).values_list('id', 'item', *INVENTORY_FIELDS)
+        existing.update((item, (pk, tuple(values))) for pk, item, *values in rows)
+
+    new_items = []
+    changed_items = []
+    for item, values in records.items():
+        fields = dict(zip(INVENTORY_FIELDS, values))
+        if item not in existing:
+            new_items.append(MasterInventory(item=item, status=0, **fields))
+        elif existing[item][1] != values:
+            changed_items.append(MasterInventory(id=existing[item][0], item=item, status=0, **fields))
+
+    MasterInventory.objects.bulk_create(new_items, batch_size=INVENTORY_BATCH_SIZE)
+    MasterInventory.objects.bulk_update(changed_items, INVENTORY_FIELDS + ['status'], batch_size=INVENTORY_BATCH_SIZE)
+    return len(new_items), len(changed_items), len(records) - len(new_items) - len(changed_items)
+
+
+def import_inventory_file(claimed_path):
+    """
+    Import one claimed inventory file and move it to the processed or error folder.
+
+    All rows and the move to processed are committed together, so a file is
+    never left half imported. Content already imported under any file name is
+    recognised by its hash in the IngestedFile ledger and skipped unparsed.
+
+    Only new and changed items are written; see upsert_inventory().
+
+    Returns:
+        tuple: (items created or updated, errors)
+    """
+    file = original_name(claimed_path)
+    logger.info(f"Processing inventory file: {file}")
+    logger.info(f"Full file path: {claimed_path}")
+    processed_count = 0
+    error_count = 0
+    sha256 = None
+    
+    try:
+        # A streamed hash is enough to skip content that was already imported under any name
+        sha256, size = file_digest(claimed_path)
+        imported = find_imported('inventory', sha256)
+        if imported:
+            raise DuplicateFileError(imported)
+        
+        # Read only the needed columns of the Excel, CSV or Parquet file;
+        # column names come back lowercased for case-insensitive matching
+        df = read_table(claimed_path, INVENTORY_COLUMNS)
+        logger.info(f"Successfully read file. Found {len(df)} records in file {file}")
+        logger.info(f"DataFrame columns: {list(df.columns)}")
+        
+        with transaction.atomic():
+            # The ledger entry commits with the rows, so concurrent copies cannot both import
+            ledger_entry = start_ingest('inventory', sha256, size, file)
+            
+            records, row_errors = normalize_inventory_frame(df)
+            for index, message in row_errors:
+                logger.error(f"Skipping row {index} in file {file}: {message}")
+                logger.error(f"Row data: {df.loc[index].to_dict()}")
+            error_count = len(row_errors)
+            
+            created, updated, unchanged = upsert_inventory(records)
+            processed_count = created + updated
+            logger.info(f"Inventory items from file {file}: {created} created, {updated} updated, {unchanged} unchanged")
+            
+            finish_ingest(ledger_entry, len(df))
+            publish_inventory_update('process_inventory_file', created=created, updated=updated)
+            
+            # Move file to processed folder before the rows commit
+            claimed_path = finish_claim(claimed_path, 'processed')
+        
+    except DuplicateFileError as duplicate:
+        record_duplicate(duplicate.entry, file)
+        finish_claim(claimed_path, 'error')
+        return 0, 1
+        
+    except Exception as file_error:
+        logger.error(f"Error processing file {file}: {str(file_error)}")
+        logger.exception("Full traceback:")
+        # Move file to error folder
+        try:
+            finish_claim(claimed_path, 'error')
+        except OSError as move_error:
+            logger.error(f"Could not move {claimed_path} to the error folder: {str(move_error)}")
+        if sha256:
+            try:
+                record_failure('inventory', sha256, size, file)
+            except Exception as ledger_error:
+                logger.error(f"Could not record failed import of {file}: {str(ledger_error)}")
+        return 0, error_count + 1
+    
+    return processed_count, error_count
+
+
 @shared_task(name='Portal.tasks.import_inventory.process_inventory_files')
+@single_instance()
 def process_inventory_files():
-    """Process inventory files from the specified folder"""
+    """Queue one import task per inventory file in the inventory folder"""
     try:
         logger.info("="*80)
         logger.info("Starting inventory file processing task")
         
-        # Use the Inventory subfolder
-        import_folder = os.path.join(settings.WATCH_FOLDER, 'Inventory')
+        # Use the inventory subfolder
+        import_folder = get_folder_path('inventory')
+        if not import_folder:
+            logger.error("Could not get inventory folder path")
+            return "Could not get inventory folder path"
+            
         logger.info(f"Looking for files in: {import_folder}")
         
         if not os.path.exists(import_folder):
             logger.warning(f"Import folder does not exist: {import_folder}")
             return "Import folder does not exist"
+        
+        # Put back files whose worker died before finishing them
+        recovered = recover_stale_claims('inventory')
+        if recovered:
+            logger.warning(f"Recovered {len(recovered)} stale inventory files")
 
-        # Get list of Excel files
+        # Get list of inventory files
         all_files = os.listdir(import_folder)
         logger.info(f"All files in directory: {all_files}")
         
-        files = [f for f in all_files if f.endswith(('.xlsx', '.xls'))]
-        logger.info(f"Excel files found: {files}")
+        # Only files whose size and mtime have settled, so half-copied files wait for the next run
+        files = stable_files(import_folder)
+        logger.info(f"Inventory files ready: {files}")
         
         if not files:
             logger.info("No inventory files to process")
             return "No files to process"
 
-        processed_count = 0
-        error_count = 0
+        # Each file is claimed and imported by its own task, spread across the workers
+        group(process_inventory_file.s(os.path.join(import_folder, file)) for file in files).apply_async()
         
-        for file in files:
-            file_path = os.path.join(import_folder, file)
-            logger.info(f"Processing inventory file: {file}")
-            logger.info(f"Full file path: {file_path}")
-            
-            try:
-                # Read Excel file
-                df = pd.read_excel(file_path)
-                logger.info(f"Successfully read Excel file. Found {len(df)} records in file {file}")
-                logger.info(f"DataFrame columns: {list(df.columns)}")
-                
-                # Convert column names to lowercase for case-insensitive matching
-                df.columns = df.columns.str.lower()
-                
-                # Process each row
-                for _, row in df.iterrows():
-                    try:
-                        # Create or update inventory item
-                        inventory_item, created = MasterInventory.objects.update_or_create(
-                            item=row['item'],
-                            defaults={
-                                'description': row['description'],
-                                'uom': row['uom'],
-                                'cus1': row.get('cus1'),
-                                'cus2': row.get('cus2'),
-                                'cus3': row.get('cus3'),
-                                'status': 0  # Reset status for new/updated items
-                            }
-                        )
-                        
-                        action = "Created" if created else "Updated"
-                        logger.info(f"{action} inventory item: {row['item']}")
-                        processed_count += 1
-                        
-                    except Exception as row_error:
-                        logger.error(f"Error processing row {_} in file {file}: {str(row_error)}")
-                        logger.error(f"Row data: {row.to_dict()}")
-                        error_count += 1
-                
-                # Move file to processed folder
-                processed_folder = os.path.join(settings.WATCH_FOLDER, 'processed')
-                os.makedirs(processed_folder, exist_ok=True)
-                processed_path = os.path.join(processed_folder, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{file}")
-                logger.info(f"Moving file from {file_path} to {processed_path}")
-                os.rename(file_path, processed_path)
-                logger.info(f"Successfully moved processed file to: {processed_path}")
-                
-            except Exception as file_error:
-                logger.error(f"Error processing file {file}: {str(file_error)}")
-                logger.exception("Full traceback:")
-                # Move file to error folder
-                error_folder = os.path.join(settings.WATCH_FOLDER, 'error')
-                os.makedirs(error_folder, exist_ok=True)
-                error_path = os.path.join(error_folder, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{file}")
-                os.rename(file_path, error_path)
-                logger.error(f"Moved error file to: {error_path}")
-                error_count += 1
-
-        logger.info(f"Task completed. Processed {processed_count} items with {error_count} errors")
-        return f"Processed {processed_count} items with {error_count} errors"
+        logger.info(f"Queued {len(files)} inventory files")
+        return f"Queued {len(files)} inventory files"
         
     except Exception as e:
         logger.error(f"Critical error in process_inventory_files: {str(e)}")
         logger.exception("Full traceback:")
-        return f"Error: {str(e)}" 
\ No newline at end of file
+        return f"Error: {str(e)}"
+
+
+@shared_task(name='Portal.tasks.import_inventory.process_inventory_file')
+def process_inventory_file(file_path):
+    """Claim and import a single inventory file"""
+    claimed_path = claim_file(file_path, 'inventory')
+    if not claimed_path:
+        logger.info(f"Inventory file already claimed by another worker: {file_path}")
+        return "File already claimed"
+    
+    # Keep the claim fresh for as long as the import runs, so it is never recovered under us
+    with claim_heartbeat(claimed_path):
+        processed_count, error_count = import_inventory_file(claimed_path)
+    return f"Processed {processed_count} items with {error_count} errors"
\ No newline at end of file
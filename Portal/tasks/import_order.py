@@ -1,19 +1,317 @@
 import os
 import pandas as pd
-import numpy as np  # Add this import to handle NaN checks
-from celery import shared_task
+from celery import shared_task, group
+from django.db import transaction, IntegrityError
 from django.utils import timezone
-from ..models import OrderData, WarehouseLocation
+from ..models import OrderData, OrderDataArchive, WarehouseLocation
 from ..utils.folder_setup import get_folder_path
+from ..utils.watcher import stable_files
+from ..utils.file_claims import claim_file, claim_heartbeat, renew_claim, finish_claim, original_name, recover_stale_claims
+from ..utils.readers import read_table, iter_table_chunks, clean_text, ORDER_COLUMNS
+from ..utils.ingest_ledger import (
+    DuplicateFileError, file_digest, find_imported, record_duplicate, start_ingest, finish_ingest, record_failure
+)
+from ..utils.batching import chunked, IN_CLAUSE_BATCH_SIZE
+from ..utils.locks import single_instance
+from ..utils.kpis import invalidate_order_kpis
+from ..utils.events import publish_order_update
 import logging
-from datetime import datetime
 
 # Set up logger
 logger = logging.getLogger('order_import')
 
+# Columns every order file must provide (after lowercasing)
+REQUIRED_COLUMNS = ['order', 'type', 'item', 'quantity']
+
+# Number of rows sent to the database per INSERT statement
+BULK_CREATE_BATCH_SIZE = int(os.getenv('ORDER_IMPORT_BATCH_SIZE', '1000'))
+
+# Files at least this large are streamed in blocks of ORDER_IMPORT_CHUNK_ROWS rows
+# instead of being loaded whole; smaller files use the fastest whole-file reader
+ORDER_IMPORT_CHUNK_BYTES = int(os.getenv('ORDER_IMPORT_CHUNK_BYTES', str(20 * 1024 * 1024)))
+ORDER_IMPORT_CHUNK_ROWS = int(os.getenv('ORDER_IMPORT_CHUNK_ROWS', '50000'))
+
+
+def normalize_order_frame(df, location_lookup, order_line_counters=None):
+    """
+    Normalize an order DataFrame in a single vectorized pass.
+
+    Lowercases the column names, converts NaN to None, strips locations,
+    maps them to bin locations and numbers the lines of each order in file order.
+
+    When a file is imported in chunks, pass the same order_line_counters dict
+    for every chunk: it holds the lines already numbered per order and is
+    updated in place, so numbering carries on across chunks.
+
+    Returns:
+        tuple: (DataFrame of valid rows, list of (row index, error message) tuples)
+    """
+    # Convert column names to lowercase for case-insensitive matching
+    df.columns = df.columns.str.lower()
+
+    missing_columns = [column for column in REQUIRED_COLUMNS if column not in df.columns]
+    if missing_columns:
+        raise KeyError(f"Missing required columns {missing_columns}. Available columns: {list(df.columns)}")
+
+    # Convert NaN to None to ensure NULL in the database
+    order_number = clean_text(df['order'])
+    transaction_type = clean_text(df['type'])
+    item = clean_text(df['item'])
+    quantity = pd.to_numeric(df['quantity'], errors='coerce')
+
+    # Preserve the location value and lookup bin location
+    if 'location' in df.columns:
+        wms_location = clean_text(df['location'])
+    else:
+        wms_location = pd.Series([None] * len(df), index=df.index, dtype=object)
+    bin_location = wms_location.map(location_lookup)
+    bin_location = bin_location.astype(object).where(bin_location.notna(), None)
+
+    # Number the lines of each order in the order they appear in the file
+    order_line = order_number.groupby(order_number).cumcount() + 1
+    if order_line_counters is not None:
+        if order_line_counters:
+            order_line += order_number.map(order_line_counters).fillna(0).astype('int64')
+        for number, count in order_number.value_counts().items():
+            order_line_counters[number] = order_line_counters.get(number, 0) + count
+
+    # Collect per-row validation errors instead of failing the whole file
+    checks = [
+        (order_number.isna(), "missing order number"),
+        (transaction_type.isna(), "missing transaction type"),
+        (item.isna(), "missing item"),
+        (quantity.isna(), "missing or non-numeric quantity"),
+        (quantity.notna() & (quantity != quantity.round()), "quantity is not a whole number"),
+    ]
+    invalid = pd.Series(False, index=df.index)
+    errors = []
+    for mask, message in checks:
+        for index in mask[mask & ~invalid].index:
+            errors.append((index, message))
+        invalid |= mask
+
+    valid = ~invalid
+    normalized = pd.DataFrame({
+        'order_number': order_number[valid],
+        'transaction_type': transaction_type[valid],
+        'item': item[valid],
+        'quantity': quantity[valid].astype('int64'),
+        'wms_location': wms_location[valid],
+        'bin_location': bin_location[valid],
+        'order_line': order_line[valid].astype('int64'),
+    })
+
+    unmapped = normalized['wms_location'].notna() & normalized['bin_location'].isna()
+    if unmapped.any():
+        sample = normalized.loc[unmapped, 'wms_location'].unique()[:10]
+        logger.info(f"No bin location found for {int(unmapped.sum())} rows. WMS locations (first 10): {list(sample)}")
+
+    return normalized, sorted(errors)
+
+
+def existing_order_lines(order_numbers):
+    """
+    Look up the lines already stored for the given order numbers.
+
+    Lines the archive task has moved out of OrderData count as stored too, so an
+    exported order is not imported and sent to the API a second time.
+
+    Returns:
+        dict: Maps (order_number, order_line) to the live row id, or to None for archived lines
+    """
+    existing = {}
+    for batch in chunked(order_numbers, IN_CLAUSE_BATCH_SIZE):
+        archived = OrderDataArchive.objects.filter(order_number__in=batch).values_list('order_number', 'order_line')
+        existing.update((key, None) for key in archived)
+        rows = OrderData.objects.filter(order_number__in=batch).values_list('id', 'order_number', 'order_line')
+        existing.update(((order_number, order_line), pk) for pk, order_number, order_line in rows)
+    return existing
+
+
+def bulk_insert_orders(normalized, file_name):
+    """
+    Persist normalized order rows with chunked bulk_create.
+
+    Must be called inside a transaction so a file is imported all-or-nothing.
+    Each chunk runs in a savepoint. If another import stored one of its order
+    lines after the duplicate check, the chunk is retried one row at a time and
+    the clashing rows are returned instead of failing the whole file.
+
+    Returns:
+        list: Index labels of the rows skipped because their order line exists
+    """
+    processed_at = timezone.now()
+    inserted = 0
+    duplicates = []
+
+    for start in range(0, len(normalized), BULK_CREATE_BATCH_SIZE):
+        chunk = normalized.iloc[start:start + BULK_CREATE_BATCH_SIZE]
+        orders = [
+            OrderData(
+                order_number=row.order_number,
+                transaction_type=row.transaction_type,
+                item=row.item,
+                quantity=int(row.quantity),
+                sent_status=0,
+                file_name=file_name,
+                wms_location=row.wms_location,
+                bin_location=row.bin_location,
+                order_line=int(row.order_line),
+                processed_at=processed_at,
+            )
+            for row in chunk.itertuples(index=False)
+        ]
+        try:
+            with transaction.atomic():
+                OrderData.objects.bulk_create(orders, batch_size=BULK_CREATE_BATCH_SIZE)
+            inserted += len(orders)
+        except IntegrityError:
+            logger.warning(f"Order lines in rows {start}-{start + len(orders) - 1} of {file_name} were stored by "
+                           f"another import; inserting them one at a time")
+            for index, order in zip(chunk.index, orders):
+                try:
+                    with transaction.atomic():
+                        OrderData.objects.bulk_create([order])
+                    inserted += 1
+                except IntegrityError:
+                    duplicates.append(index)
+        logger.debug(f"Inserted {inserted}/{len(normalized)} rows from file {file_name}")
+
+    return duplicates
+
+
+def import_order_rows(df, file_name, location_lookup, order_line_counters):
+    """
+    Validate and insert one block of rows from an order file.
+
+    Must be called inside the file's transaction. Lines already stored for an
+    order number, by an earlier file or the staging import, are reported as
+    row errors and skipped, including lines since moved to the archive; the
+    rest of the file is still imported.
+
+    Returns:
+        tuple: (DataFrame of inserted rows, number of rows skipped)
+    """
+    normalized, row_errors = normalize_order_frame(df, location_lookup, order_line_counters)
+    
+    # Order lines are unique, so lines that already exist are reported rather than inserted twice
+    existing = existing_order_lines(normalized['order_number'].unique())
+    if existing:
+        keys = list(zip(normalized['order_number'], normalized['order_line']))
+        duplicate = pd.Series([key in existing for key in keys], index=normalized.index)
+        row_errors += [
+            (index, "order line already exists" if existing[key] is not None else "order line already exported and archived")
+            for index, key, is_duplicate in zip(normalized.index, keys, duplicate) if is_duplicate
+        ]
+        # A reused order number loses every line it shares with the old order, so say so per order
+        for order_number, skipped in normalized.loc[duplicate, 'order_number'].value_counts().items():
+            logger.warning(f"Skipped {skipped} lines of order {order_number} in file {file_name} because they were "
+                           f"already imported; if the order number was reused, send the new order under a new number")
+        normalized = normalized[~duplicate]
+    
+    stored_meanwhile = bulk_insert_orders(normalized, file_name)
+    if stored_meanwhile:
+        row_errors += [(index, "order line already exists") for index in stored_meanwhile]
+        normalized = normalized.drop(stored_meanwhile)
+    
+    for index, message in sorted(row_errors):
+        logger.error(f"Skipping row {index} in file {file_name}: {message}")
+        logger.error(f"Row data: {df.loc[index].to_dict()}")
+    
+    return normalized, len(row_errors)
+
+
+def import_order_file(claimed_path, location_lookup):
+    """
+    Import one claimed order file and move it to the processed or error folder.
+
+    The rows and the move to processed are committed together: the file is
+    renamed inside the transaction, so a failed rename rolls the rows back and
+    a failed import never leaves the file looking processed.
+
+    Files of ORDER_IMPORT_CHUNK_BYTES or more are read and written in blocks of
+    ORDER_IMPORT_CHUNK_ROWS rows, so memory use does not grow with file size.
+
+    Content already imported under any file name is recognised by its hash in
+    the IngestedFile ledger and moved to the error folder without being parsed.
+
+    Returns:
+        tuple: (order lines created, errors)
+    """
+    file = original_name(claimed_path)
+    logger.info(f"Processing order file: {file}")
+    logger.info(f"Full file path: {claimed_path}")
+    sha256 = None
+    
+    try:
+        # A streamed hash is enough to skip content that was already imported under any name
+        sha256, size = file_digest(claimed_path)
+        imported = find_imported('orders', sha256)
+        if imported:
+            raise DuplicateFileError(imported)
+        
+        # Read only the needed columns of the Excel, CSV or Parquet file
+        if size >= ORDER_IMPORT_CHUNK_BYTES:
+            logger.info(f"Reading {file} in chunks of {ORDER_IMPORT_CHUNK_ROWS} rows")
+            frames = iter_table_chunks(claimed_path, ORDER_COLUMNS, ORDER_IMPORT_CHUNK_ROWS)
+        else:
+            frames = [read_table(claimed_path, ORDER_COLUMNS)]
+        
+        row_count = 0
+        inserted = 0
+        error_count = 0
+        order_numbers = set()
+        # Lines numbered so far per order, carried from one chunk to the next
+        order_line_counters = {}
+        
+        # Insert all valid rows of the file and move it to processed as one unit.
+        # If the commit itself fails, the handler below moves the file on from processed to error.
+        with transaction.atomic():
+            # The ledger entry commits with the rows, so concurrent copies cannot both import
+            ledger_entry = start_ingest('orders', sha256, size, file)
+            for df in frames:
+                logger.info(f"Read {len(df)} records from {file}")
+                logger.debug(f"DataFrame columns: {list(df.columns)}")
+                
+                normalized, errors = import_order_rows(df, file, location_lookup, order_line_counters)
+                row_count += len(df)
+                inserted += len(normalized)
+                error_count += errors
+                order_numbers.update(normalized['order_number'].unique())
+                renew_claim(claimed_path)
+            finish_ingest(ledger_entry, row_count)
+            claimed_path = finish_claim(claimed_path, 'processed')
+            invalidate_order_kpis()
+            publish_order_update('process_order_file', imported=inserted)
+        logger.info(f"Created {inserted} order lines for {len(order_numbers)} orders from file {file}")
+        
+        return inserted, error_count
+        
+    except DuplicateFileError as duplicate:
+        record_duplicate(duplicate.entry, file)
+        finish_claim(claimed_path, 'error')
+        return 0, 1
+        
+    except Exception as file_error:
+        logger.error(f"Error processing file {file}: {str(file_error)}")
+        logger.exception("Full traceback:")
+        # Move file to error folder
+        try:
+            finish_claim(claimed_path, 'error')
+        except OSError as move_error:
+            logger.error(f"Could not move {claimed_path} to the error folder: {str(move_error)}")
+        if sha256:
+            try:
+                record_failure('orders', sha256, size, file)
+            except Exception as ledger_error:
+                logger.error(f"Could not record failed import of {file}: {str(ledger_error)}")
+        return 0, 1
+
+
 @shared_task(name='Portal.tasks.import_order.process_excel_files')
+@single_instance()
 def process_excel_files():
-    """Process Excel files from the specified folder"""
+    """Queue one import task per order file in the orders folder"""
     try:
         logger.info("="*80)
         logger.info("Starting order file processing task")
@@ -29,124 +327,49 @@ def process_excel_files():
         if not os.path.exists(import_folder):
             logger.warning(f"Import folder does not exist: {import_folder}")
             return "Import folder does not exist"
+        
+        # Put back files whose worker died before finishing them
+        recovered = recover_stale_claims('orders')
+        if recovered:
+            logger.warning(f"Recovered {len(recovered)} stale order files")
 
-        # Get list of Excel files
+        # Get list of order files
         all_files = os.listdir(import_folder)
         logger.info(f"All files in directory: {all_files}")
         
-        files = [f for f in all_files if f.endswith(('.xlsx', '.xls'))]
-        logger.info(f"Excel files found: {files}")
+        # Only files whose size and mtime have settled, so half-copied files wait for the next run
+        files = stable_files(import_folder)
+        logger.info(f"Order files ready: {files}")
         
         if not files:
             logger.info("No order files to process")
             return "No files to process"
 
-        processed_count = 0
-        error_count = 0
-        
-        # Create a location lookup dictionary for faster lookups
-        location_lookup = {loc.wms_location: loc.cn_bin for loc in WarehouseLocation.objects.all()}
-        logger.info(f"Loaded {len(location_lookup)} warehouse locations for lookup")
+        # Each file is claimed and imported by its own task, spread across the workers
+        group(process_order_file.s(os.path.join(import_folder, file)) for file in files).apply_async()
         
-        for file in files:
-            file_path = os.path.join(import_folder, file)
-            logger.info(f"Processing order file: {file}")
-            logger.info(f"Full file path: {file_path}")
-            
-            try:
-                # Read Excel file
-                df = pd.read_excel(file_path)
-                logger.info(f"Successfully read Excel file. Found {len(df)} records")
-                logger.info(f"DataFrame columns: {list(df.columns)}")
-                
-                # Convert column names to lowercase for case-insensitive matching
-                df.columns = df.columns.str.lower()
-                
-                # Dictionary to keep track of line numbers for each order
-                order_line_counters = {}
-                
-                # Process each row
-                for index, row in df.iterrows():
-                    try:
-                        # Get the order number and initialize/increment line counter
-                        order_number = row['order']
-                        if order_number not in order_line_counters:
-                            order_line_counters[order_number] = 1
-                        current_line_number = order_line_counters[order_number]
-                        order_line_counters[order_number] += 1
-
-                        # Get the location value, default to None if missing
-                        location_value = row.get('location')
-                        # Convert NaN to None to ensure NULL in the database
-                        if pd.isna(location_value):
-                            location_value = None
-                            bin_location = None
-                        else:
-                            # Preserve the location value and lookup bin location
-                            location_value = str(location_value).strip()  # Ensure string and remove whitespace
-                            bin_location = location_lookup.get(location_value)
-                            if not bin_location:
-                                logger.info(f"No bin location found for WMS location: {location_value}")
-
-                        # Map Excel columns to model fields
-                        order_data = {
-                            'order_number': order_number,
-                            'transaction_type': row['type'],
-                            'item': row['item'],
-                            'quantity': row['quantity'],
-                            'sent_status': 0,
-                            'file_name': file,
-                            'wms_location': location_value,
-                            'bin_location': bin_location,
-                            'order_line': current_line_number,
-                            'processed_at': timezone.now(),  # Use timezone-aware datetime
-                        }
-                        
-                        # Create order
-                        order = OrderData.objects.create(**order_data)
-                        logger.info(f"Created order: {order.order_number} - Line {current_line_number} - {order.item} (Qty: {order.quantity}, Location: {location_value}, Bin: {bin_location})")
-                        processed_count += 1
-                        
-                    except KeyError as key_error:
-                        logger.error(f"Missing required column in row {index}: {str(key_error)}")
-                        logger.error(f"Available columns: {list(df.columns)}")
-                        logger.error(f"Row data: {row.to_dict()}")
-                        error_count += 1
-                    except Exception as row_error:
-                        logger.error(f"Error processing row {index} in file {file}: {str(row_error)}")
-                        logger.error(f"Row data: {row.to_dict()}")
-                        logger.exception("Full traceback:")
-                        error_count += 1
-                
-                # Move file to processed folder
-                processed_folder = get_folder_path('processed')
-                if processed_folder:
-                    os.makedirs(processed_folder, exist_ok=True)
-                    processed_path = os.path.join(processed_folder, f"{timezone.now().strftime('%Y%m%d_%H%M%S')}_{file}")
-                    logger.info(f"Moving file from {file_path} to {processed_path}")
-                    os.rename(file_path, processed_path)
-                    logger.info(f"Successfully moved processed file to: {processed_path}")
-                
-            except Exception as file_error:
-                logger.error(f"Error processing file {file}: {str(file_error)}")
-                logger.exception("Full traceback:")
-                # Move file to error folder
-                error_folder = get_folder_path('error')
-                if error_folder:
-                    os.makedirs(error_folder, exist_ok=True)
-                    error_path = os.path.join(error_folder, f"{timezone.now().strftime('%Y%m%d_%H%M%S')}_{file}")
-                    os.rename(file_path, error_path)
-                    logger.error(f"Moved error file to: {error_path}")
-                error_count += 1
-
-        logger.info(f"Task completed. Processed {processed_count} orders with {error_count} errors")
-        return f"Processed {processed_count} orders with {error_count} errors"
+        logger.info(f"Queued {len(files)} order files")
+        return f"Queued {len(files)} order files"
         
     except Exception as e:
         logger.error(f"Critical error in process_excel_files: {str(e)}")
         logger.exception("Full traceback:")
         return f"Error: {str(e)}"
 
+@shared_task(name='Portal.tasks.import_order.process_order_file')
+def process_order_file(file_path):
+    """Claim and import a single order file"""
+    claimed_path = claim_file(file_path, 'orders')
+    if not claimed_path:
+        logger.info(f"Order file already claimed by another worker: {file_path}")
+        return "File already claimed"
+    
+    location_lookup = dict(WarehouseLocation.objects.values_list('wms_location', 'cn_bin'))
+    # Keep the claim fresh for as long as the import runs, so it is never recovered under us
+    with claim_heartbeat(claimed_path):
+        processed_count, error_count = import_order_file(claimed_path, location_lookup)
+    return f"Processed {processed_count} orders with {error_count} errors"
+
 # Schedule the task to run every 10 seconds
 @shared_task
 def schedule_file_processing():
@@ -19,4 +19,18 @@ def get_range(total_pages, current_page):
         page_range.add(page)
     
     # Convert to sorted list
-    return sorted(list(page_range)) 
\ No newline at end of file
+    return sorted(list(page_range))
+
+@register.simple_tag(takes_context=True)
+def sort_query(context, column):
+    """
+    Build the querystring for a sortable column header from the current request.
+    Keeps the search, filters and page size, and flips the direction when the
+    column is already the sort. The page position is dropped, since cursors
+    only point into the order they were made for.
+    """
+    query = context['request'].GET.copy()
+    for name in ('after', 'before', 'last', 'page'):
+        query.pop(name, None)
+    query['sort_by'] = f"-{column}" if query.get('sort_by') == column else column
+    return f"?{query.urlencode()}"
@@ -13,4 +13,6 @@ urlpatterns = [
     path('reset-order/<int:order_id>/', views.reset_order_status, name='reset_order_status'),
     path('inventory/', views.inventory, name='inventory'),
     path('reset_inventory_status/<int:item_id>/', views.reset_inventory_status, name='reset_inventory_status'),
+    path('events/', views.event_stream, name='event_stream'),
+    path('export/', views.export_orders, name='export_orders'),
 ] 
\ No newline at end of file
@@ -0,0 +1,24 @@
+from itertools import islice
+
+# SQL Server rejects statements with more than 2100 parameters, so large
+# IN (...) filters are split into batches of this size
+IN_CLAUSE_BATCH_SIZE = 1000
+
+
+def chunked(iterable, size):
+    """
+    Yield successive lists of at most `size` items from any iterable.
+
+    Args:
+        iterable: Items to split into batches
+        size (int): Maximum number of items per batch
+
+    Yields:
+        list: The next batch of items
+    """
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
@@ -0,0 +1,164 @@
+import os
+import json
+import time
+import logging
+import threading
+import redis
+from django.core.cache import cache
+from django.db import transaction
+from Portal.utils.locks import get_redis
+from Portal.utils.kpis import ORDER_KPI_CACHE_KEY, get_order_kpis
+
+logger = logging.getLogger(__name__)
+
+# Redis pub/sub channel the tasks publish dashboard events on
+EVENTS_CHANNEL = 'portal:events'
+
+# Seconds between keep-alive comments on an idle stream, and seconds one stream
+# stays open before the browser is told to reconnect, so web workers are recycled
+EVENT_STREAM_KEEPALIVE = int(os.getenv('EVENT_STREAM_KEEPALIVE', '15'))
+EVENT_STREAM_MAX_AGE = int(os.getenv('EVENT_STREAM_MAX_AGE', '300'))
+
+# Milliseconds the browser waits before reconnecting a closed stream
+EVENT_STREAM_RETRY_MS = 3000
+
+# Streams one web process serves at once. Each holds a worker thread for as long
+# as it is open, so this leaves the rest of the threads for page requests.
+EVENT_STREAM_MAX_CONNECTIONS = int(os.getenv('EVENT_STREAM_MAX_CONNECTIONS', '8'))
+
+# Milliseconds a screen turned away by the connection cap waits before trying again
+EVENT_STREAM_BUSY_RETRY_MS = 30000
+
+# Seconds between KPI refreshes sent to one screen, however many order events arrive
+EVENT_KPI_INTERVAL = float(os.getenv('EVENT_KPI_INTERVAL', '5'))
+
+_open_streams = 0
+_open_streams_lock = threading.Lock()
+
+
+def _publish(event):
+    try:
+        get_redis().publish(EVENTS_CHANNEL, json.dumps(event))
+    except redis.exceptions.RedisError as e:
+        logger.warning(f"Could not publish {event['type']} event: {str(e)}")
+
+
+def publish_order_update(source, **transitions):
+    """
+    Tell connected dashboards that order lines changed status.
+
+    Runs once the surrounding transaction commits. Only the change is sent; the
+    cached KPIs are cleared, and each stream refreshes them at most every
+    EVENT_KPI_INTERVAL seconds, so a burst of events costs one recount.
+
+    Args:
+        source (str): Task or view that made the change
+        **transitions: Lines moved per outcome, e.g. sent=40, failed=2
+    """
+    transitions = {name: count for name, count in transitions.items() if count}
+    if not transitions:
+        return
+
+    def publish():
+        cache.delete(ORDER_KPI_CACHE_KEY)
+        _publish({'type': 'orders', 'source': source, 'transitions': transitions})
+
+    transaction.on_commit(publish)
+
+
+def publish_inventory_update(source, **transitions):
+    """
+    Tell connected inventory screens that items were imported or pushed.
+
+    Args:
+        source (str): Task or view that made the change
+        **transitions: Items changed per outcome, e.g. updated=100, error=3
+    """
+    transitions = {name: count for name, count in transitions.items() if count}
+    if transitions:
+        transaction.on_commit(lambda: _publish({'type': 'inventory', 'source': source, 'transitions': transitions}))
+
+
+def _format_event(event_type, data):
+    return f"event: {event_type}\ndata: {json.dumps(data)}\n\n"
+
+
+def _kpi_changes(kpis, last_kpis):
+    return {name: value - last_kpis.get(name, 0) for name, value in kpis.items() if value != last_kpis.get(name, 0)}
+
+
+def _open_stream():
+    global _open_streams
+    with _open_streams_lock:
+        if _open_streams >= EVENT_STREAM_MAX_CONNECTIONS:
+            return False
+        _open_streams += 1
+        return True
+
+
+def _close_stream():
+    global _open_streams
+    with _open_streams_lock:
+        _open_streams -= 1
+
+
+def stream_events(keepalive=EVENT_STREAM_KEEPALIVE, max_age=EVENT_STREAM_MAX_AGE, kpi_interval=EVENT_KPI_INTERVAL):
+    """
+    Yield server-sent events for one connected screen.
+
+    Starts with the current KPIs, then relays every published event. After
+    order events the KPIs are read again from the cache, at most every
+    `kpi_interval` seconds, and sent as a `kpis` event with `kpi_changes`, the
+    difference from the KPIs this screen last received. A comment is sent when
+    the stream has been idle for `keepalive` seconds so proxies keep it open,
+    and the stream ends after `max_age` seconds; the browser reconnects on its own.
+
+    Once EVENT_STREAM_MAX_CONNECTIONS streams are open in this process, new
+    screens are told to retry later instead.
+    """
+    if not _open_stream():
+        logger.warning(f"Turning away an event stream; {EVENT_STREAM_MAX_CONNECTIONS} already open")
+        yield f"retry: {EVENT_STREAM_BUSY_RETRY_MS}\n\n"
+        return
+
+    pubsub = None
+    try:
+        pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(EVENTS_CHANNEL)
+        last_kpis = get_order_kpis()
+        yield f"retry: {EVENT_STREAM_RETRY_MS}\n\n"
+        yield _format_event('kpis', {'kpis': last_kpis})
+
+        kpis_due = False
+        last_kpis_sent = last_sent = started = time.monotonic()
+        while time.monotonic() - started < max_age:
+            timeout = keepalive
+            if kpis_due:
+                timeout = max(0, min(keepalive, kpi_interval - (time.monotonic() - last_kpis_sent)))
+            message = pubsub.get_message(timeout=timeout)
+
+            if kpis_due and time.monotonic() - last_kpis_sent >= kpi_interval:
+                kpis = get_order_kpis()
+                yield _format_event('kpis', {'kpis': kpis, 'kpi_changes': _kpi_changes(kpis, last_kpis)})
+                last_kpis = kpis
+                kpis_due = False
+                last_kpis_sent = last_sent = time.monotonic()
+
+            if message is None:
+                if time.monotonic() - last_sent >= keepalive:
+                    yield ": keepalive\n\n"
+                    last_sent = time.monotonic()
+                continue
+
+            event = json.loads(message['data'])
+            if event['type'] == 'orders':
+                kpis_due = True
+            yield _format_event(event['type'], event)
+            last_sent = time.monotonic()
+
+    except redis.exceptions.RedisError as e:
+        logger.warning(f"Event stream closed: {str(e)}")
+    finally:
+        if pubsub is not None:
+            pubsub.close()
+        _close_stream()
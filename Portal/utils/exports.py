@@ -0,0 +1,107 @@
+import os
+import io
+import csv
+import tempfile
+from datetime import datetime
+import xlsxwriter
+from django.utils import timezone
+
+# Order export columns, in order, with the OrderData field each is read from
+EXPORT_COLUMNS = [
+    ('Order Number', 'order_number'),
+    ('Transaction Type', 'transaction_type'),
+    ('Item', 'item'),
+    ('Quantity Requested', 'quantity'),
+    ('Actual Quantity', 'actual_qty'),
+    ('Shortage Quantity', 'shortage_qty'),
+    ('WMS Location', 'wms_location'),
+    ('Bin Location', 'bin_location'),
+    ('Order Line', 'order_line'),
+    ('Processed At', 'processed_at'),
+    ('File Name', 'file_name'),
+    ('User', 'user'),
+    ('API Error', 'api_error'),
+]
+EXPORT_HEADERS = [header for header, _ in EXPORT_COLUMNS]
+EXPORT_FIELDS = [field for _, field in EXPORT_COLUMNS]
+PROCESSED_AT_POSITION = EXPORT_FIELDS.index('processed_at')
+
+# Rows written between chunks handed to the web server while streaming
+EXPORT_STREAM_CHUNK_ROWS = int(os.getenv('EXPORT_STREAM_CHUNK_ROWS', '1000'))
+
+# Bytes of a finished workbook file sent per chunk
+EXPORT_FILE_CHUNK_BYTES = int(os.getenv('EXPORT_FILE_CHUNK_BYTES', '65536'))
+
+# xlsxwriter options for every exported workbook: cells hold exactly what is
+# stored, with no formulas or links made from order text
+XLSX_CELL_OPTIONS = {
+    'strings_to_formulas': False,
+    'strings_to_urls': False,
+}
+
+
+def export_row(line):
+    """Make a line's values writable to Excel, which has no time zones"""
+    row = list(line)
+    if row[PROCESSED_AT_POSITION] is not None:
+        row[PROCESSED_AT_POSITION] = timezone.localtime(row[PROCESSED_AT_POSITION]).replace(tzinfo=None)
+    return row
+
+
+def stream_csv(headers, rows, chunk_rows=EXPORT_STREAM_CHUNK_ROWS):
+    """
+    Yield a CSV file in chunks of `chunk_rows` rows.
+
+    Starts with a UTF-8 byte order mark so Excel opens non-ASCII text correctly.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def take():
+        data = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    buffer.write('\ufeff')
+    writer.writerow(headers)
+    yield take()
+
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if count % chunk_rows == 0:
+            yield take()
+    yield take()
+
+
+def stream_xlsx(headers, rows, chunk_bytes=EXPORT_FILE_CHUNK_BYTES):
+    """
+    Yield an .xlsx workbook with one sheet, written by xlsxwriter.
+
+    constant_memory mode flushes each row to disk as soon as the next one is
+    started, so memory stays flat. A workbook is a zip that can only be sent once
+    it is complete, though: nothing is yielded until every row is in the
+    temporary file, which grows with the row count. Callers bound the row count;
+    CSV is the format for exports of any size. The file is then sent in chunks of
+    `chunk_bytes` and removed once sent or the download is abandoned.
+    """
+    with tempfile.TemporaryFile() as output:
+        workbook = xlsxwriter.Workbook(output, {'constant_memory': True, 'in_memory': False, **XLSX_CELL_OPTIONS})
+        sheet = workbook.add_worksheet('Orders')
+        date_format = workbook.add_format({'num_format': 'yyyy-mm-dd hh:mm:ss'})
+
+        sheet.write_row(0, 0, headers)
+        for number, row in enumerate(rows, start=1):
+            for column, value in enumerate(row):
+                if isinstance(value, datetime):
+                    sheet.write_datetime(number, column, value, date_format)
+                elif value is not None:
+                    sheet.write(number, column, value)
+        workbook.close()
+
+        output.seek(0)
+        while True:
+            chunk = output.read(chunk_bytes)
+            if not chunk:
+                break
+            yield chunk
@@ -0,0 +1,156 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from contextlib import contextmanager
+from django.utils import timezone
+from .folder_setup import get_folder_path
+
+logger = logging.getLogger(__name__)
+
+# Seconds without a heartbeat after which a claimed file is handed back to its folder
+CLAIM_TIMEOUT = int(os.getenv('IMPORT_CLAIM_TIMEOUT', '600'))
+
+# Seconds between heartbeats on a claimed file while its import runs
+CLAIM_HEARTBEAT_INTERVAL = int(os.getenv('IMPORT_CLAIM_HEARTBEAT_INTERVAL', '60'))
+
+# Separates the claim token from the original file name inside the in-progress folder
+CLAIM_SEPARATOR = '__'
+
+
+def _claim_folder(source):
+    in_progress = get_folder_path('in_progress')
+    if not in_progress:
+        return None
+    folder = os.path.join(in_progress, source)
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def original_name(claimed_path):
+    """Return the file name a claimed file had before it was claimed"""
+    return os.path.basename(claimed_path).split(CLAIM_SEPARATOR, 1)[-1]
+
+
+def claim_file(file_path, source):
+    """
+    Take ownership of a file by renaming it into the in-progress folder.
+
+    The rename is atomic, so when several workers race for the same file exactly
+    one of them gets it. The claimed file's mtime is set to the claim time and
+    serves as the claim's heartbeat, renewed by renew_claim() while the import
+    runs; recover_stale_claims() measures against it.
+
+    Args:
+        file_path (str): Path of the file in its watch folder
+        source (str): Folder type the file came from ('orders' or 'inventory')
+
+    Returns:
+        str: Path of the claimed file, or None if another worker claimed it first
+    """
+    folder = _claim_folder(source)
+    if not folder:
+        return None
+    claimed_path = os.path.join(folder, f"{uuid.uuid4().hex}{CLAIM_SEPARATOR}{os.path.basename(file_path)}")
+    try:
+        os.rename(file_path, claimed_path)
+    except FileNotFoundError:
+        return None
+    os.utime(claimed_path)
+    logger.info(f"Claimed {file_path} as {claimed_path}")
+    return claimed_path
+
+
+def renew_claim(claimed_path):
+    """
+    Mark a claim as still being worked on by touching the claimed file.
+
+    Returns:
+        bool: False once the file has moved on, True otherwise
+    """
+    try:
+        os.utime(claimed_path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+@contextmanager
+def claim_heartbeat(claimed_path, interval=CLAIM_HEARTBEAT_INTERVAL):
+    """
+    Renew a claim every `interval` seconds from a background thread.
+
+    Keeps a claim fresh through long steps that report no progress, such as
+    reading a large file or committing its rows. The heartbeat stops when the
+    block exits or the file is moved out of the in-progress folder.
+    """
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(interval):
+            if not renew_claim(claimed_path):
+                return
+
+    thread = threading.Thread(target=beat, name=f"claim-heartbeat-{original_name(claimed_path)}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def finish_claim(claimed_path, outcome):
+    """
+    Move a claimed file to its final folder under a timestamped name.
+
+    Args:
+        claimed_path (str): Path returned by claim_file()
+        outcome (str): Destination folder type ('processed' or 'error')
+
+    Returns:
+        str: New path of the file
+    """
+    folder = get_folder_path(outcome)
+    os.makedirs(folder, exist_ok=True)
+    final_path = os.path.join(folder, f"{timezone.now().strftime('%Y%m%d_%H%M%S')}_{original_name(claimed_path)}")
+    os.rename(claimed_path, final_path)
+    logger.info(f"Moved {original_name(claimed_path)} to: {final_path}")
+    return final_path
+
+
+def recover_stale_claims(source, timeout=CLAIM_TIMEOUT):
+    """
+    Hand claimed files back to their watch folder when their worker died mid-import.
+
+    A claim is stale once its heartbeat, the claimed file's mtime, is older than
+    `timeout`. Imports that are still running renew it, however long they take.
+
+    Returns:
+        list: Paths of the files put back
+    """
+    in_progress = get_folder_path('in_progress')
+    source_folder = get_folder_path(source)
+    if not in_progress or not source_folder:
+        return []
+
+    folder = os.path.join(in_progress, source)
+    if not os.path.isdir(folder):
+        return []
+
+    recovered = []
+    cutoff = time.time() - timeout
+    for name in os.listdir(folder):
+        claimed_path = os.path.join(folder, name)
+        try:
+            if os.path.getmtime(claimed_path) > cutoff:
+                continue
+            restored_path = os.path.join(source_folder, original_name(claimed_path))
+            os.rename(claimed_path, restored_path)
+        except OSError as e:
+            logger.warning(f"Could not recover claimed file {claimed_path}: {str(e)}")
+            continue
+        logger.warning(f"Recovered stale claim {claimed_path} back to {restored_path}")
+        recovered.append(restored_path)
+    return recovered
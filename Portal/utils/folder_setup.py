@@ -17,14 +17,16 @@ def ensure_folders_exist():
             logger.error("WATCH_FOLDER environment variable is not set")
             return False
 
-        # Define all required subfolders
+        # Define all required subfolders. Inventory files have always been read from
+        # WATCH_FOLDER/Inventory, which case-sensitive file systems keep apart from 'inventory'
         subfolders = {
-            'inventory': os.getenv('INVENTORY_IMPORT_FOLDER', 'inventory'),
+            'inventory': os.getenv('INVENTORY_IMPORT_FOLDER', 'Inventory'),
             'orders': os.getenv('ORDERS_IMPORT_FOLDER', 'orders'),
             'export': os.getenv('ORDERS_EXPORT_FOLDER', 'export'),
             'processed': os.getenv('PROCESSED_FOLDER', 'processed'),
             'error': os.getenv('ERROR_FOLDER', 'error'),
             'archive': os.getenv('ARCHIVE_FOLDER', 'archive'),
+            'in_progress': os.getenv('IN_PROGRESS_FOLDER', 'in_progress'),
             'logs': os.getenv('LOGS_FOLDER', 'logs')
         }
 
@@ -66,12 +68,13 @@ def get_folder_path(folder_type):
         return None
 
     folder_mapping = {
-        'inventory': os.getenv('INVENTORY_IMPORT_FOLDER', 'inventory'),
+        'inventory': os.getenv('INVENTORY_IMPORT_FOLDER', 'Inventory'),
         'orders': os.getenv('ORDERS_IMPORT_FOLDER', 'orders'),
         'export': os.getenv('ORDERS_EXPORT_FOLDER', 'export'),
         'processed': os.getenv('PROCESSED_FOLDER', 'processed'),
         'error': os.getenv('ERROR_FOLDER', 'error'),
         'archive': os.getenv('ARCHIVE_FOLDER', 'archive'),
+        'in_progress': os.getenv('IN_PROGRESS_FOLDER', 'in_progress'),
         'logs': os.getenv('LOGS_FOLDER', 'logs')
     }
 
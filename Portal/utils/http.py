@@ -0,0 +1,22 @@
+import requests
+from requests.adapters import HTTPAdapter
+
+
+def build_session(pool_size=10):
+    """
+    Create a requests Session that keeps connections alive between calls.
+
+    The connection pool is sized so that `pool_size` threads can share the
+    session without opening throwaway connections.
+
+    Args:
+        pool_size (int): Maximum number of pooled connections per host
+
+    Returns:
+        requests.Session: Session with pooled HTTP and HTTPS adapters
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
@@ -0,0 +1,101 @@
+import hashlib
+import logging
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from Portal.models import IngestedFile
+
+logger = logging.getLogger(__name__)
+
+# Bytes read per step while hashing, so large files never sit in memory whole
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+class DuplicateFileError(Exception):
+    """Raised when a file's content has already been imported"""
+
+    def __init__(self, entry):
+        self.entry = entry
+        super().__init__(f"Same content as {entry.file_name}, imported {entry.ingested_at:%Y-%m-%d %H:%M:%S}")
+
+
+def file_digest(path):
+    """
+    Hash a file in blocks.
+
+    Returns:
+        tuple: (sha256 hex digest, size in bytes)
+    """
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+            size += len(block)
+    return digest.hexdigest(), size
+
+
+def find_imported(kind, sha256):
+    """Return the ledger entry of a successful import with this content, if any"""
+    return IngestedFile.objects.filter(kind=kind, sha256=sha256, outcome='processed').first()
+
+
+def record_duplicate(entry, file_name):
+    """Count a re-drop of already imported content against its ledger entry"""
+    IngestedFile.objects.filter(pk=entry.pk).update(duplicate_count=F('duplicate_count') + 1)
+    logger.warning(f"Skipping {file_name}: same content as {entry.file_name}, already imported")
+
+
+def start_ingest(kind, sha256, size, file_name):
+    """
+    Claim the ledger entry for a file's content inside the import transaction.
+
+    The entry commits or rolls back together with the imported rows, and the
+    unique (kind, sha256) constraint makes a second worker importing the same
+    content at the same time fail here instead of inserting twice. Content
+    whose earlier import failed may be imported again.
+
+    Returns:
+        IngestedFile: Entry to finish with finish_ingest()
+
+    Raises:
+        DuplicateFileError: The content has already been imported
+    """
+    entry = IngestedFile.objects.select_for_update().filter(kind=kind, sha256=sha256).first()
+    if entry is not None:
+        if entry.outcome == 'processed':
+            raise DuplicateFileError(entry)
+        entry.file_name = file_name
+        entry.size = size
+        return entry
+
+    try:
+        # Savepoint, so losing the race does not break the surrounding transaction
+        with transaction.atomic():
+            return IngestedFile.objects.create(
+                kind=kind, sha256=sha256, size=size, file_name=file_name, outcome='processed'
+            )
+    except IntegrityError:
+        raise DuplicateFileError(IngestedFile.objects.get(kind=kind, sha256=sha256))
+
+
+def finish_ingest(entry, row_count):
+    """Mark a ledger entry as successfully imported"""
+    entry.row_count = row_count
+    entry.outcome = 'processed'
+    entry.save()
+
+
+def record_failure(kind, sha256, size, file_name):
+    """Record a failed import so the same content can be retried later"""
+    entry, created = IngestedFile.objects.get_or_create(
+        kind=kind,
+        sha256=sha256,
+        defaults={'size': size, 'file_name': file_name, 'outcome': 'error'},
+    )
+    # Never downgrade content that another file already imported successfully
+    if not created and entry.outcome != 'processed':
+        entry.size = size
+        entry.file_name = file_name
+        entry.outcome = 'error'
+        entry.row_count = 0
+        entry.save()
@@ -0,0 +1,48 @@
+import os
+import logging
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+from Portal.models import OrderData
+
+logger = logging.getLogger(__name__)
+
+# Seconds the dashboard KPIs are served from the cache. Tasks that change line
+# statuses clear it straight away, so this only bounds staleness from other writers.
+ORDER_KPI_CACHE_TTL = int(os.getenv('ORDER_KPI_CACHE_TTL', '15'))
+
+ORDER_KPI_CACHE_KEY = 'order-kpis'
+
+
+def compute_order_kpis():
+    """
+    Count the order lines in each dashboard status with a single aggregate query.
+
+    Returns:
+        dict: total_orders, pending_orders, sent_orders and failed_orders
+    """
+    return OrderData.objects.aggregate(
+        total_orders=Count('id'),
+        pending_orders=Count('id', filter=Q(sent_status=0) | Q(sent_status__isnull=True)),
+        sent_orders=Count('id', filter=Q(sent_status=1)),
+        failed_orders=Count('id', filter=Q(sent_status=99)),
+    )
+
+
+def get_order_kpis():
+    """Return the dashboard KPIs, from the cache when a recent count is there"""
+    kpis = cache.get(ORDER_KPI_CACHE_KEY)
+    if kpis is None:
+        kpis = compute_order_kpis()
+        cache.set(ORDER_KPI_CACHE_KEY, kpis, ORDER_KPI_CACHE_TTL)
+    return kpis
+
+
+def invalidate_order_kpis():
+    """
+    Drop the cached KPIs after order lines are added, removed or change status.
+
+    Inside a transaction the cache is cleared once it commits, so a dashboard
+    refresh in between cannot cache the old counts again.
+    """
+    transaction.on_commit(lambda: cache.delete(ORDER_KPI_CACHE_KEY))
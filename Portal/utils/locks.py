@@ -0,0 +1,123 @@
+import os
+import functools
+import logging
+import threading
+import redis
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Seconds a task lock survives without renewal. Running tasks renew it every
+# third of this, so it only matters when a worker dies while holding the lock.
+TASK_LOCK_TTL = int(os.getenv('TASK_LOCK_TTL', '60'))
+
+# Redis hashes recording skipped ticks per task
+SKIP_COUNT_KEY = 'portal:task-skips'
+LAST_SKIP_KEY = 'portal:task-last-skip'
+
+_redis_client = None
+
+
+def get_redis():
+    """Return a shared client for the Redis instance used as the Celery broker"""
+    global _redis_client
+    if _redis_client is None:
+        _redis_client = redis.Redis.from_url(settings.CELERY_BROKER_URL)
+    return _redis_client
+
+
+def get_skipped_runs():
+    """
+    Return how many ticks each task has skipped because its previous run was still going.
+
+    Shown per task in the TaskConfig admin; tasks are keyed by lock name, which
+    is the task's TaskConfig.task_name.
+
+    Returns:
+        dict: Maps task name to {'count': int, 'last_skipped': ISO timestamp or None}
+    """
+    client = get_redis()
+    counts = client.hgetall(SKIP_COUNT_KEY)
+    last_skips = client.hgetall(LAST_SKIP_KEY)
+    return {
+        name.decode(): {
+            'count': int(count),
+            'last_skipped': last_skips[name].decode() if name in last_skips else None,
+        }
+        for name, count in counts.items()
+    }
+
+
+def _renew_lock(lock, ttl, stop):
+    """Keep extending a held lock until `stop` is set"""
+    while not stop.wait(ttl / 3):
+        try:
+            lock.extend(ttl, replace_ttl=True)
+        except redis.exceptions.LockError:
+            logger.error(f"Lost task lock {lock.name}; another run may start")
+            return
+        except redis.exceptions.RedisError as e:
+            logger.warning(f"Could not renew task lock {lock.name}: {str(e)}")
+
+
+def single_instance(name=None, ttl=TASK_LOCK_TTL):
+    """
+    Decorator that stops a task from running while a previous run still holds its lock.
+
+    The lock is a Redis lease on the broker instance, renewed in the background
+    for as long as the task runs. A tick that finds the lock held is skipped and
+    recorded instead of waiting.
+
+    Args:
+        name (str): Lock name, defaults to the decorated function's dotted path
+        ttl (int): Lease length in seconds
+
+    Usage:
+        @shared_task(name='Portal.tasks.example')
+        @single_instance()
+        def example():
+            ...
+    """
+    def decorator(func):
+        task_name = name or f"{func.__module__}.{func.__name__}"
+        lock_name = f"portal:task-lock:{task_name}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            client = get_redis()
+            # The token is shared with the renewal thread, so it must not be thread-local
+            lock = client.lock(lock_name, timeout=ttl, thread_local=False)
+
+            try:
+                acquired = lock.acquire(blocking=False)
+            except redis.exceptions.RedisError as e:
+                logger.error(f"Could not acquire task lock for {task_name}, skipping run: {str(e)}")
+                return f"Skipped: task lock unavailable ({str(e)})"
+
+            if not acquired:
+                try:
+                    client.hincrby(SKIP_COUNT_KEY, task_name, 1)
+                    client.hset(LAST_SKIP_KEY, task_name, timezone.now().isoformat())
+                except redis.exceptions.RedisError as e:
+                    logger.warning(f"Could not record skipped run for {task_name}: {str(e)}")
+                logger.warning(f"Skipping {task_name}: previous run is still in progress")
+                return "Skipped: previous run still in progress"
+
+            stop = threading.Event()
+            renewer = threading.Thread(target=_renew_lock, args=(lock, ttl, stop), daemon=True)
+            renewer.start()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stop.set()
+                renewer.join()
+                try:
+                    lock.release()
+                except redis.exceptions.LockError:
+                    logger.warning(f"Task lock for {task_name} expired before the run finished")
+                except redis.exceptions.RedisError as e:
+                    logger.warning(f"Could not release task lock for {task_name}: {str(e)}")
+
+        return wrapper
+    return decorator
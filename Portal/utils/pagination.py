@@ -0,0 +1,183 @@
+import os
+import json
+import base64
+import hashlib
+from datetime import date, datetime, time
+from decimal import Decimal
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import Count, F, Q
+
+# Seconds a filtered row count is reused between page loads and grid refreshes
+PAGINATION_COUNT_CACHE_TTL = int(os.getenv('PAGINATION_COUNT_CACHE_TTL', '30'))
+# Deepest page a link by page number may open with OFFSET; deeper pages are only
+# reached by following cursors, so no request scans more than this many pages
+PAGINATION_MAX_OFFSET_PAGE = int(os.getenv('PAGINATION_MAX_OFFSET_PAGE', '10'))
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded"""
+
+
+def resolve_sort(sort_by, sort_fields, default):
+    """
+    Map a requested sort onto a model field, falling back to `default` for unknown sorts.
+
+    Args:
+        sort_by (str): Requested sort, optionally prefixed with '-' for descending
+        sort_fields (dict): Accepted sort names mapped to model field names
+        default (str): Sort used when the request names an unknown column
+
+    Returns:
+        str: Model field name, prefixed with '-' when descending
+    """
+    descending = sort_by.startswith('-')
+    field_name = sort_fields.get(sort_by.lstrip('-'))
+    if field_name is None:
+        return default
+    return f"-{field_name}" if descending else field_name
+
+
+def _cursor_value(value):
+    # Full precision, so a cursor always seeks to exactly the row it came from
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def encode_cursor(sort_value, pk):
+    """Pack a row's sort value and primary key into an opaque URL-safe token"""
+    payload = json.dumps([_cursor_value(sort_value), pk], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, field):
+    """
+    Unpack a token made by encode_cursor().
+
+    Returns:
+        tuple: (sort value converted for `field`, primary key)
+
+    Raises:
+        InvalidCursor: The token is malformed or does not fit the field
+    """
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        sort_value, pk = json.loads(payload)
+        if sort_value is not None:
+            sort_value = field.to_python(sort_value)
+        return sort_value, int(pk)
+    except (ValueError, TypeError, ValidationError) as e:
+        raise InvalidCursor(f"Invalid pagination cursor: {str(e)}")
+
+
+def _ordering(field_name, nullable, descending):
+    # NULLs go first ascending and last descending on every backend, so the seek
+    # filter below does not depend on the database's own NULL ordering
+    if descending:
+        return [F(field_name).desc(nulls_last=True) if nullable else f"-{field_name}", '-pk']
+    return [F(field_name).asc(nulls_first=True) if nullable else field_name, 'pk']
+
+
+def _seek(field_name, nullable, descending, value, pk):
+    """Filter for the rows that come after (value, pk) in the scan order"""
+    lookup = 'lt' if descending else 'gt'
+    if value is None:
+        rest = Q(**{f'{field_name}__isnull': True, f'pk__{lookup}': pk})
+        if not descending:
+            rest |= Q(**{f'{field_name}__isnull': False})
+        return rest
+
+    # The redundant inclusive bound gives the planner a range to seek the index
+    # to; the OR on its own makes some databases scan from the start
+    rest = Q(**{f'{field_name}__{lookup}e': value}) & (
+        Q(**{f'{field_name}__{lookup}': value}) | Q(**{field_name: value, f'pk__{lookup}': pk})
+    )
+    if nullable and descending:
+        rest |= Q(**{f'{field_name}__isnull': True})
+    return rest
+
+
+def _row_value(row, name):
+    return row[name] if isinstance(row, dict) else getattr(row, name)
+
+
+def keyset_paginate(queryset, sort_by, page_size, after=None, before=None, last=False, offset=0):
+    """
+    Fetch one page of a queryset by seeking past a cursor instead of using OFFSET.
+
+    Rows are ordered by the sort field with the primary key as tie-breaker, and
+    each page returns cursors for its first and last rows. Following a cursor
+    costs the same however deep the page is, provided the sort column is indexed.
+    Without a cursor the page starts at `offset` (kept for links by page number),
+    and `last` fetches the final page by scanning from the end.
+
+    Args:
+        queryset: Filtered rows, as model instances or values() dicts including 'id'
+        sort_by (str): Model field, prefixed with '-' for descending
+        page_size (int): Rows per page
+        after (str): Cursor of the row just before the wanted page
+        before (str): Cursor of the row just after the wanted page
+        last (bool): Fetch the last page
+        offset (int): Rows to skip when no cursor is given
+
+    Returns:
+        dict: items, has_next, has_previous, next_cursor, previous_cursor
+
+    Raises:
+        InvalidCursor: `after` or `before` cannot be decoded
+    """
+    descending = sort_by.startswith('-')
+    field_name = sort_by.lstrip('-')
+    field = queryset.model._meta.get_field(field_name)
+    pk_name = queryset.model._meta.pk.attname
+
+    backwards = bool(before) or last
+    cursor = before or after
+    rows = queryset.order_by(*_ordering(field_name, field.null, descending != backwards))
+    if cursor:
+        value, pk = decode_cursor(cursor, field)
+        rows = rows.filter(_seek(field_name, field.null, descending != backwards, value, pk))
+    if cursor or backwards:
+        offset = 0
+
+    items = list(rows[offset:offset + page_size + 1])
+    has_more = len(items) > page_size
+    items = items[:page_size]
+    if backwards:
+        items.reverse()
+        has_next, has_previous = bool(before), has_more
+    else:
+        has_next, has_previous = has_more, bool(after) or offset > 0
+
+    return {
+        'items': items,
+        'has_next': has_next,
+        'has_previous': has_previous,
+        'next_cursor': encode_cursor(_row_value(items[-1], field.attname), _row_value(items[-1], pk_name)) if has_next and items else None,
+        'previous_cursor': encode_cursor(_row_value(items[0], field.attname), _row_value(items[0], pk_name)) if has_previous and items else None,
+    }
+
+
+def cached_aggregate(queryset, ttl=PAGINATION_COUNT_CACHE_TTL, **aggregates):
+    """
+    Run queryset.aggregate() and reuse the result for `ttl` seconds.
+
+    The cache key is derived from the query's SQL, so every distinct filter
+    combination is cached on its own.
+    """
+    queryset = queryset.order_by()
+    sql, params = queryset.query.sql_with_params()
+    key = 'aggregate:' + hashlib.sha256(f"{sql}|{params}|{sorted((name, repr(aggregate)) for name, aggregate in aggregates.items())}".encode()).hexdigest()
+    result = cache.get(key)
+    if result is None:
+        result = queryset.aggregate(**aggregates)
+        cache.set(key, result, ttl)
+    return result
+
+
+def cached_count(queryset, ttl=PAGINATION_COUNT_CACHE_TTL):
+    """Count a queryset, reusing the count for `ttl` seconds"""
+    return cached_aggregate(queryset, ttl, row_count=Count('pk'))['row_count']
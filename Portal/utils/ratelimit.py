@@ -0,0 +1,72 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket limiting how many requests start per second.
+
+    Tokens refill continuously at `rate` per second up to `burst`; each request
+    takes one token and waits when the bucket is empty.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst or rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """Block until a token is available, then take it"""
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class AdaptiveTokenBucket(TokenBucket):
+    """
+    Token bucket that backs off when the remote side slows down.
+
+    Response latencies are smoothed with an exponentially weighted moving average.
+    While the average is above `latency_target` the rate is halved (down to
+    `min_rate`); once it recovers the rate climbs back by 10% of the configured
+    rate per healthy response.
+    """
+
+    def __init__(self, rate, latency_target, min_rate=1.0, burst=None, smoothing=0.2):
+        super().__init__(rate, burst)
+        self.max_rate = self.rate
+        self.min_rate = min(float(min_rate), self.rate)
+        self.latency_target = float(latency_target)
+        self.smoothing = smoothing
+        self.average_latency = None
+        self._last_backoff = 0.0
+
+    def record_latency(self, seconds):
+        """Feed one observed response time into the rate controller"""
+        with self._lock:
+            self._refill()
+            if self.average_latency is None:
+                self.average_latency = seconds
+            else:
+                self.average_latency += self.smoothing * (seconds - self.average_latency)
+
+            now = time.monotonic()
+            if self.average_latency > self.latency_target:
+                # Halve at most once per target interval so one slow burst is not punished repeatedly
+                if now - self._last_backoff >= self.latency_target:
+                    self.rate = max(self.min_rate, self.rate / 2)
+                    self._last_backoff = now
+            elif self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * 0.1)
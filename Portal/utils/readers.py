@@ -0,0 +1,261 @@
+import os
+import logging
+import importlib.util
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Columns read from each kind of file, matched case-insensitively, with the dtype
+# each is read as. Text columns are read as strings so codes like "00123" keep their
+# leading zeros; quantity is left as-is so bad cells become row errors, not file errors.
+ORDER_COLUMNS = {'order': str, 'type': str, 'item': str, 'quantity': object, 'location': str}
+INVENTORY_COLUMNS = {'item': str, 'description': str, 'uom': str, 'cus1': str, 'cus2': str, 'cus3': str}
+
+EXCEL_EXTENSIONS = ('.xlsx', '.xlsm', '.xls')
+CSV_EXTENSIONS = ('.csv',)
+PARQUET_EXTENSIONS = ('.parquet',)
+SUPPORTED_EXTENSIONS = EXCEL_EXTENSIONS + CSV_EXTENSIONS + PARQUET_EXTENSIONS
+
+# Excel engine: 'auto' (calamine when installed, otherwise openpyxl-stream),
+# 'calamine', 'openpyxl' (pandas' reader) or 'openpyxl-stream' (row streaming)
+EXCEL_READER_ENGINE = os.getenv('EXCEL_READER_ENGINE', 'auto')
+
+EXCEL_ENGINES = ('calamine', 'openpyxl', 'openpyxl-stream')
+
+
+def available_engines():
+    """Return the Excel engines that can be used in this environment"""
+    engines = []
+    if importlib.util.find_spec('python_calamine'):
+        engines.append('calamine')
+    if importlib.util.find_spec('openpyxl'):
+        engines.extend(['openpyxl', 'openpyxl-stream'])
+    return engines
+
+
+def resolve_engine(engine=None, extension='.xlsx'):
+    """
+    Pick the Excel engine to read a file with.
+
+    Returns:
+        str: Engine name, or None to let pandas choose (legacy .xls without calamine)
+    """
+    engine = engine or EXCEL_READER_ENGINE
+    available = available_engines()
+    if engine == 'auto':
+        engine = 'calamine' if 'calamine' in available else 'openpyxl-stream'
+    elif engine not in EXCEL_ENGINES:
+        raise ValueError(f"Unknown Excel reader engine {engine!r}. Choose from: auto, {', '.join(EXCEL_ENGINES)}")
+    elif engine not in available:
+        logger.warning(f"Excel reader engine {engine} is not installed, falling back to openpyxl-stream")
+        engine = 'openpyxl-stream'
+
+    # openpyxl cannot open the old binary format
+    if extension == '.xls' and engine != 'calamine':
+        return None
+    return engine
+
+
+def _plan(header, columns):
+    """Map the file's own column names onto the wanted lowercase names"""
+    rename = {}
+    for name in header:
+        key = str(name).strip().lower()
+        if key in columns and key not in rename.values():
+            rename[name] = key
+    dtypes = {name: columns[key] for name, key in rename.items()}
+    return list(rename), dtypes, rename
+
+
+def _as_text(value):
+    """Convert a cell to text the way pandas does for dtype=str, keeping blanks as None"""
+    if value is None or (isinstance(value, float) and value != value):
+        return None
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _iter_excel_rows(path, columns):
+    """
+    Stream the wanted columns of the first sheet with a read-only openpyxl workbook.
+
+    Yields the wanted column names first, then one tuple of cells per row. Only
+    the wanted cells of each row are kept, and empty rows at the end of the sheet
+    are dropped to match pandas.
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, ())
+        positions = {}
+        for position, name in enumerate(header):
+            key = str(name).strip().lower() if name is not None else None
+            if key in columns and key not in positions:
+                positions[key] = position
+        yield list(positions)
+
+        # Empty rows are held back until a non-empty row shows they are not trailing
+        blank_rows = []
+        for row in rows:
+            values = tuple(row[position] if position < len(row) else None for position in positions.values())
+            if all(value is None for value in values):
+                blank_rows.append(values)
+                continue
+            yield from blank_rows
+            blank_rows = []
+            yield values
+    finally:
+        workbook.close()
+
+
+def _stream_frame(data, names, columns, start=0):
+    frame = pd.DataFrame(data, columns=names, dtype=object, index=pd.RangeIndex(start, start + len(data)))
+    for key in names:
+        if columns[key] is str:
+            frame[key] = frame[key].map(_as_text)
+    return frame
+
+
+def clean_text(column):
+    """Convert a column to stripped strings, with NaN and blank cells as None"""
+    cleaned = column.astype(object).where(column.notna(), '').astype(str).str.strip()
+    return cleaned.astype(object).where(cleaned != '', None)
+
+
+def _read_excel_stream(path, columns):
+    """
+    Read the wanted columns of the first sheet by streaming rows with openpyxl.
+
+    Avoids building a full frame of every column first.
+    """
+    rows = _iter_excel_rows(path, columns)
+    names = next(rows)
+    return _stream_frame(list(rows), names, columns)
+
+
+def _read_parquet(path, columns):
+    try:
+        import pyarrow.parquet as pq
+        header = pq.read_schema(path).names
+    except ImportError:
+        # fastparquet has no cheap schema read here, so read every column
+        header = None
+
+    if header is None:
+        frame = pd.read_parquet(path)
+        usecols, dtypes, rename = _plan(frame.columns, columns)
+        frame = frame[usecols]
+    else:
+        usecols, dtypes, rename = _plan(header, columns)
+        frame = pd.read_parquet(path, columns=usecols)
+
+    # Parquet columns are already typed, so only non-text columns need converting
+    for name, dtype in dtypes.items():
+        if dtype is str and not pd.api.types.is_string_dtype(frame[name]):
+            frame[name] = frame[name].astype(object).map(_as_text)
+    return frame.rename(columns=rename)
+
+
+def read_table(path, columns, engine=None):
+    """
+    Read the wanted columns of an order or inventory file into a DataFrame.
+
+    Excel, CSV and Parquet files are all accepted; the format is taken from the
+    file extension. Only the columns in `columns` are read and the result has
+    them under their lowercase names. Columns missing from the file are simply
+    absent, so callers still report them.
+
+    Args:
+        path (str): File to read
+        columns (dict): Wanted lowercase column names mapped to their dtype
+        engine (str): Excel engine, defaults to EXCEL_READER_ENGINE
+
+    Returns:
+        DataFrame: One row per data row of the file
+    """
+    extension = os.path.splitext(path)[1].lower()
+
+    if extension in CSV_EXTENSIONS:
+        usecols, dtypes, rename = _plan(pd.read_csv(path, nrows=0).columns, columns)
+        frame = pd.read_csv(path, usecols=usecols, dtype=dtypes).rename(columns=rename)
+        engine = 'csv'
+    elif extension in PARQUET_EXTENSIONS:
+        frame = _read_parquet(path, columns)
+        engine = 'parquet'
+    elif extension in EXCEL_EXTENSIONS:
+        engine = resolve_engine(engine, extension)
+        if engine == 'openpyxl-stream':
+            frame = _read_excel_stream(path, columns)
+        else:
+            usecols, dtypes, rename = _plan(pd.read_excel(path, engine=engine, nrows=0).columns, columns)
+            if usecols:
+                frame = pd.read_excel(path, engine=engine, usecols=usecols, dtype=dtypes).rename(columns=rename)
+            else:
+                frame = pd.DataFrame()
+    else:
+        raise ValueError(f"Unsupported file type {extension!r}. Supported: {', '.join(SUPPORTED_EXTENSIONS)}")
+
+    logger.debug(f"Read {len(frame)} rows from {os.path.basename(path)} with {engine or 'default'} reader")
+    return frame
+
+
+def iter_table_chunks(path, columns, chunk_rows, engine=None):
+    """
+    Read a file in blocks of at most `chunk_rows` rows, for files too large to hold at once.
+
+    Yields DataFrames shaped like read_table() output whose index continues from
+    one block to the next, so row numbers stay meaningful across the whole file.
+    Excel files are streamed with openpyxl and CSV/Parquet files are read in
+    batches, so memory stays flat whatever the file size. Legacy .xls files
+    cannot be streamed and are read whole, then split.
+
+    Args:
+        path (str): File to read
+        columns (dict): Wanted lowercase column names mapped to their dtype
+        chunk_rows (int): Maximum rows per block
+        engine (str): Excel engine, only used for .xls files
+    """
+    extension = os.path.splitext(path)[1].lower()
+
+    if extension in CSV_EXTENSIONS:
+        usecols, dtypes, rename = _plan(pd.read_csv(path, nrows=0).columns, columns)
+        with pd.read_csv(path, usecols=usecols, dtype=dtypes, chunksize=chunk_rows) as reader:
+            for frame in reader:
+                yield frame.rename(columns=rename)
+
+    elif extension in PARQUET_EXTENSIONS and importlib.util.find_spec('pyarrow'):
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(path)
+        usecols, dtypes, rename = _plan(parquet_file.schema_arrow.names, columns)
+        start = 0
+        for batch in parquet_file.iter_batches(batch_size=chunk_rows, columns=usecols):
+            frame = batch.to_pandas()
+            frame.index = pd.RangeIndex(start, start + len(frame))
+            start += len(frame)
+            for name, dtype in dtypes.items():
+                if dtype is str and not pd.api.types.is_string_dtype(frame[name]):
+                    frame[name] = frame[name].astype(object).map(_as_text)
+            yield frame.rename(columns=rename)
+
+    elif extension in EXCEL_EXTENSIONS and extension != '.xls':
+        rows = _iter_excel_rows(path, columns)
+        names = next(rows)
+        start = 0
+        block = []
+        for row in rows:
+            block.append(row)
+            if len(block) >= chunk_rows:
+                yield _stream_frame(block, names, columns, start)
+                start += len(block)
+                block = []
+        if block or not start:
+            yield _stream_frame(block, names, columns, start)
+
+    else:
+        frame = read_table(path, columns, engine)
+        for start in range(0, max(len(frame), 1), chunk_rows):
+            yield frame.iloc[start:start + chunk_rows]
@@ -0,0 +1,151 @@
+import logging
+import importlib
+from django.db import connection, connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from Portal.models import OrderData, MasterInventory
+
+logger = logging.getLogger(__name__)
+
+# Per model: the text columns the search box matches, the key column used for
+# prefix lookups, and the full-text table built over the text columns
+# by migration 0030 (SQLite only; PostgreSQL indexes the table itself)
+SEARCH_CONFIG = {
+    OrderData: {'fields': ['order_number', 'item'], 'key_field': 'order_number', 'fts_table': 'Portal_order_data_fts'},
+    MasterInventory: {'fields': ['item', 'description'], 'key_field': 'item', 'fts_table': 'Portal_masterinventory_fts'},
+}
+
+# Trigram indexes need at least this many characters; shorter terms scan the table
+MIN_TRIGRAM_LENGTH = 3
+
+# Whether each model's full-text index exists, checked once per process
+_fulltext_available = {}
+
+# Triggers migration 0030 creates on SQLite to keep each FTS5 table in step
+SQLITE_TRIGGER_SUFFIXES = ('ai', 'ad', 'au')
+
+
+def _contains(fields, term):
+    query = Q()
+    for field in fields:
+        query |= Q(**{f'{field}__icontains': term})
+    return query
+
+
+def _prefix_range(field, prefix):
+    """
+    Match values starting with `prefix` as a range on the column.
+
+    A range is served by the column's index on every backend, unlike LIKE on
+    SQLite. The typed and upper-case spellings are both tried, since order
+    numbers and item codes are usually stored upper case.
+    """
+    query = Q()
+    for variant in dict.fromkeys([prefix, prefix.upper()]):
+        upper_bound = variant[:-1] + chr(ord(variant[-1]) + 1)
+        query |= Q(**{f'{field}__gte': variant, f'{field}__lt': upper_bound})
+    return query
+
+
+def _sqlite_fulltext_state(cursor, model):
+    """Return (whether the FTS5 table exists, how many of its sync triggers exist)"""
+    fts_table = SEARCH_CONFIG[model]['fts_table']
+    cursor.execute(
+        "SELECT type, COUNT(*) FROM sqlite_master WHERE (type = 'table' AND name = %s) "
+        "OR (type = 'trigger' AND tbl_name = %s AND name IN (%s, %s, %s)) GROUP BY type",
+        [fts_table, model._meta.db_table] + [f'{fts_table}_{suffix}' for suffix in SQLITE_TRIGGER_SUFFIXES],
+    )
+    counts = dict(cursor.fetchall())
+    return bool(counts.get('table')), counts.get('trigger', 0)
+
+
+def has_fulltext_index(model):
+    """
+    Return whether migration 0030 built a usable SQLite full-text table for the model.
+
+    The table is only trusted while its sync triggers exist; without them the
+    FTS5 table goes stale and searches fall back to scanning.
+    """
+    if model not in _fulltext_available:
+        table = model._meta.db_table
+        with connection.cursor() as cursor:
+            has_table, trigger_count = _sqlite_fulltext_state(cursor, model)
+            _fulltext_available[model] = has_table and trigger_count == len(SQLITE_TRIGGER_SUFFIXES)
+        if not _fulltext_available[model]:
+            logger.warning(f"No full-text index for {table}; searches on it scan the table")
+    return _fulltext_available[model]
+
+
+def repair_fulltext_triggers(using='default', **kwargs):
+    """
+    Recreate SQLite full-text sync triggers dropped by a later migration.
+
+    Connected to post_migrate. SQLite rebuilds a table for most AlterField
+    operations, which drops the table's triggers but leaves the FTS5 table,
+    so the triggers are recreated and the index rebuilt from the table.
+    """
+    db = connections[using]
+    if db.vendor != 'sqlite':
+        return
+    search_indexes = importlib.import_module('Portal.migrations.0030_search_indexes')
+    with db.cursor() as cursor:
+        for model, config in SEARCH_CONFIG.items():
+            has_table, trigger_count = _sqlite_fulltext_state(cursor, model)
+            if not has_table or trigger_count == len(SQLITE_TRIGGER_SUFFIXES):
+                continue
+            fts_table = config['fts_table']
+            logger.warning(f"Recreating full-text triggers for {model._meta.db_table}")
+            for suffix in SQLITE_TRIGGER_SUFFIXES:
+                cursor.execute(f'DROP TRIGGER IF EXISTS "{fts_table}_{suffix}"')
+            search_indexes.create_sqlite_triggers(cursor, model._meta.db_table, config['fields'], fts_table)
+            cursor.execute(f'INSERT INTO "{fts_table}"("{fts_table}") VALUES (\'rebuild\')')
+            _fulltext_available.pop(model, None)
+
+
+def _text_match(model, term):
+    """
+    Build the substring filter for `term` using the database's own text index.
+
+    PostgreSQL serves icontains from pg_trgm GIN indexes on UPPER(column). SQLite
+    matches an FTS5 trigram table, which finds the same substrings as icontains.
+    Other databases, SQL Server included, and terms too short to index use
+    icontains: SQL Server full-text only matches word prefixes, so it would miss
+    substrings such as 1234 in AB1234.
+    """
+    config = SEARCH_CONFIG[model]
+    if connection.vendor != 'sqlite' or len(term) < MIN_TRIGRAM_LENGTH or not has_fulltext_index(model):
+        return _contains(config['fields'], term)
+
+    fts_table = connection.ops.quote_name(config['fts_table'])
+    matching_ids = RawSQL(f"SELECT rowid FROM {fts_table} WHERE {fts_table} MATCH %s", ['"' + term.replace('"', '""') + '"'])
+    return Q(pk__in=matching_ids)
+
+
+def apply_search(queryset, search_query):
+    """
+    Filter an OrderData or MasterInventory queryset by the grid search box.
+
+    - "SO123*" returns rows whose key (order number / item code) starts with SO123
+    - Anything else returns the rows whose text columns contain the term, exactly
+      as icontains would, through the database's text index where it has one
+
+    Args:
+        queryset: OrderData or MasterInventory rows to filter
+        search_query (str): Text typed into the search box
+
+    Returns:
+        QuerySet: The matching rows
+    """
+    term = search_query.strip()
+    if not term:
+        return queryset
+
+    model = queryset.model
+
+    if term.endswith('*'):
+        prefix = term.rstrip('*')
+        if prefix:
+            return queryset.filter(_prefix_range(SEARCH_CONFIG[model]['key_field'], prefix))
+        return queryset
+
+    return queryset.filter(_text_match(model, term))
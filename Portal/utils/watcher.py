@@ -0,0 +1,227 @@
+import os
+import time
+import logging
+import threading
+from .readers import SUPPORTED_EXTENSIONS
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:  # watchdog is optional; fall back to polling
+    Observer = None
+    FileSystemEventHandler = object
+
+logger = logging.getLogger(__name__)
+
+# Seconds a file's size and mtime must stay unchanged before it is handed off
+WATCH_STABLE_SECONDS = float(os.getenv('WATCH_STABLE_SECONDS', '1'))
+
+# Seconds between stability checks of files seen but not yet handed off
+WATCH_CHECK_INTERVAL = float(os.getenv('WATCH_CHECK_INTERVAL', '0.25'))
+
+# Seconds between full directory listings. Catches anything the OS events missed;
+# in polling mode the folders are listed every WATCH_POLL_INTERVAL instead.
+WATCH_RESCAN_INTERVAL = float(os.getenv('WATCH_RESCAN_INTERVAL', '60'))
+WATCH_POLL_INTERVAL = float(os.getenv('WATCH_POLL_INTERVAL', '2'))
+
+# Every format the import tasks can read
+WATCH_EXTENSIONS = SUPPORTED_EXTENSIONS
+
+
+def is_import_file(name, extensions=WATCH_EXTENSIONS):
+    """Whether a file name is one the import tasks should pick up"""
+    # Skip Office lock files and hidden temporary files
+    if name.startswith(('~$', '.')):
+        return False
+    return name.lower().endswith(tuple(ext.lower() for ext in extensions))
+
+
+def file_signature(path):
+    """Return a file's (size, mtime), or None once it is gone"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_size, stat.st_mtime)
+
+
+def stable_files(folder, extensions=WATCH_EXTENSIONS, stable_seconds=WATCH_STABLE_SECONDS):
+    """
+    List the import files in a folder that have finished being written.
+
+    The one-off form of FolderWatcher's check, for callers without a running
+    watcher such as the beat tasks: every file is sampled twice, `stable_seconds`
+    apart, and only files whose size and mtime did not change are returned.
+    Files still being copied are left for the next run.
+
+    Returns:
+        list: Names of the stable files
+    """
+    names = [name for name in os.listdir(folder) if is_import_file(name, extensions)]
+    if not names:
+        return []
+    before = {name: file_signature(os.path.join(folder, name)) for name in names}
+    time.sleep(stable_seconds)
+    stable = []
+    for name in names:
+        signature = file_signature(os.path.join(folder, name))
+        if signature is not None and signature == before[name]:
+            stable.append(name)
+        elif signature is not None:
+            logger.info(f"Skipping {name} for now, it is still being written")
+    return stable
+
+
+class _EventHandler(FileSystemEventHandler):
+    """Forward file events from the watchdog observer to the watcher"""
+
+    def __init__(self, watcher):
+        super().__init__()
+        self.watcher = watcher
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.watcher.note(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.watcher.note(event.src_path)
+
+    def on_closed(self, event):
+        if not event.is_directory:
+            self.watcher.note(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.watcher.note(event.dest_path)
+
+
+class FolderWatcher:
+    """
+    Watch folders for new files and hand each one off once it has finished being written.
+
+    Uses OS file events (inotify on Linux) through watchdog when it is installed,
+    otherwise lists the folders every WATCH_POLL_INTERVAL seconds. Either way a file
+    is only handed off after its size and mtime have held still for
+    WATCH_STABLE_SECONDS, so half-copied files are never picked up.
+
+    Args:
+        folders (dict): Maps folder path to a callback taking the full file path
+        extensions (tuple): File extensions to watch
+        use_events (bool): Set False to force polling even when watchdog is available
+    """
+
+    def __init__(self, folders, extensions=WATCH_EXTENSIONS, use_events=True):
+        self.folders = {os.path.abspath(folder): callback for folder, callback in folders.items()}
+        self.extensions = tuple(ext.lower() for ext in extensions)
+        self.use_events = use_events and Observer is not None
+        self._candidates = {}  # path -> (size, mtime, time the signature was first seen)
+        self._dispatched = {}  # path -> (size, mtime) when handed off
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._observer = None
+
+    def _wanted(self, path):
+        return is_import_file(os.path.basename(path), self.extensions) and os.path.dirname(os.path.abspath(path)) in self.folders
+
+    def _signature(self, path):
+        return file_signature(path)
+
+    def note(self, path):
+        """Record that a file may have appeared or changed"""
+        path = os.path.abspath(path)
+        if not self._wanted(path):
+            return
+        with self._lock:
+            if path in self._dispatched:
+                # Still the file that was handed off; a replacement with the same name is new work
+                if self._signature(path) == self._dispatched[path]:
+                    return
+                del self._dispatched[path]
+            self._candidates.setdefault(path, None)
+
+    def scan(self):
+        """List every folder, noting new files and forgetting handed-off files that are gone"""
+        for folder in self.folders:
+            try:
+                names = os.listdir(folder)
+            except OSError as e:
+                logger.warning(f"Could not list watch folder {folder}: {str(e)}")
+                continue
+            for name in names:
+                self.note(os.path.join(folder, name))
+
+        # A handed-off path is free again once the task has moved the file away
+        with self._lock:
+            self._dispatched = {
+                path: signature for path, signature in self._dispatched.items()
+                if os.path.exists(path)
+            }
+
+    def check_candidates(self):
+        """Hand off every candidate whose size and mtime have been stable long enough"""
+        now = time.monotonic()
+        with self._lock:
+            candidates = dict(self._candidates)
+
+        ready = []
+        for path, seen in candidates.items():
+            signature = self._signature(path)
+            if signature is None:
+                with self._lock:
+                    self._candidates.pop(path, None)
+                continue
+
+            if seen is None or seen[:2] != signature:
+                with self._lock:
+                    self._candidates[path] = signature + (now,)
+            elif now - seen[2] >= WATCH_STABLE_SECONDS:
+                ready.append((path, signature))
+
+        for path, signature in ready:
+            with self._lock:
+                self._candidates.pop(path, None)
+                self._dispatched[path] = signature
+            callback = self.folders[os.path.dirname(path)]
+            try:
+                callback(path)
+                logger.info(f"Queued {path}")
+            except Exception as e:
+                logger.error(f"Could not queue {path}: {str(e)}")
+                logger.exception("Full traceback:")
+                # Let the next scan retry it
+                with self._lock:
+                    self._dispatched.pop(path, None)
+
+    def start(self):
+        """Start the OS event observer, if event mode is available"""
+        if not self.use_events:
+            logger.info(f"Polling {', '.join(self.folders)} every {WATCH_POLL_INTERVAL:g}s")
+            return
+        self._observer = Observer()
+        handler = _EventHandler(self)
+        for folder in self.folders:
+            self._observer.schedule(handler, folder, recursive=False)
+        self._observer.start()
+        logger.info(f"Watching {', '.join(self.folders)} for file events")
+
+    def run(self):
+        """Watch until stop() is called"""
+        self.start()
+        rescan_interval = WATCH_RESCAN_INTERVAL if self.use_events else WATCH_POLL_INTERVAL
+        last_scan = 0.0
+        try:
+            while not self._stop.is_set():
+                # Files already present at startup are picked up by the first scan
+                if time.monotonic() - last_scan >= rescan_interval:
+                    self.scan()
+                    last_scan = time.monotonic()
+                self.check_candidates()
+                self._stop.wait(WATCH_CHECK_INTERVAL)
+        finally:
+            if self._observer is not None:
+                self._observer.stop()
+                self._observer.join()
+
+    def stop(self):
+        self._stop.set()
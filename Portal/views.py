@@ -1,18 +1,133 @@
-from django.shortcuts import render, redirect
+from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib import messages
 from .models import UserProfile, OrderData, MasterInventory
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.db.models import Q
 import os
 from dotenv import load_dotenv
 from Portal.utils.logger import general_logger as logger
-from django.core.paginator import Paginator
+from Portal.utils.kpis import get_order_kpis, invalidate_order_kpis
+from Portal.utils.search import apply_search
+from Portal.utils.events import publish_order_update, publish_inventory_update, stream_events
+from Portal.utils.pagination import keyset_paginate, resolve_sort, cached_count, cached_aggregate, InvalidCursor, PAGINATION_MAX_OFFSET_PAGE
+from Portal.utils.exports import EXPORT_FIELDS, EXPORT_HEADERS, export_row, stream_csv, stream_xlsx
+from django.db.models import Count
 from django.views.decorators.http import require_POST
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from urllib.parse import urlencode
+from datetime import datetime, time, timedelta
 
 load_dotenv()
 
+# Sort names accepted by the grids, mapped to the model field each sorts on
+ORDER_SORT_FIELDS = {
+    'order': 'order_number', 'order_number': 'order_number',
+    'type': 'transaction_type', 'transaction_type': 'transaction_type',
+    'item': 'item', 'quantity': 'quantity', 'actual_qty': 'actual_qty', 'order_line': 'order_line',
+    'status': 'sent_status', 'sent_status': 'sent_status',
+    'timestamp': 'processed_at', 'processed_at': 'processed_at',
+}
+# Order line statuses offered by the status filter
+ORDER_STATUS_CHOICES = [(0, 'Imported'), (99, 'Processing'), (1, 'Sent'), (3, 'Complete'), (4, 'Exported')]
+INVENTORY_SORT_FIELDS = {
+    'id': 'id', 'item': 'item', 'description': 'description', 'uom': 'uom',
+    'cus1': 'cus1', 'cus2': 'cus2', 'cus3': 'cus3',
+    'status': 'status', 'import_timestamp': 'import_timestamp',
+}
+
+
+# Content type and streaming writer of each order export format
+EXPORT_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', stream_csv),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', stream_xlsx),
+}
+
+# Rows fetched from the database per round trip while exporting
+EXPORT_FETCH_SIZE = int(os.getenv('EXPORT_FETCH_SIZE', '2000'))
+
+# Most rows an XLSX export may hold. A workbook can only be sent once it is
+# complete, so larger exports are refused and pointed to CSV, which streams.
+EXPORT_XLSX_MAX_ROWS = int(os.getenv('EXPORT_XLSX_MAX_ROWS', '100000'))
+
+
+def _day_start(value):
+    return timezone.make_aware(datetime.combine(value, time.min))
+
+
+def filter_orders(request):
+    """
+    Apply the order grid filters in a request: search, status and date range.
+
+    `date_from` and `date_to` are YYYY-MM-DD days in local time, both inclusive,
+    matched against processed_at. Unreadable values are ignored.
+
+    Returns:
+        tuple: (filtered OrderData queryset, dict of the filter values in use)
+    """
+    filters = {
+        'search': request.GET.get('search', ''),
+        'status': request.GET.get('status', ''),
+        'date_from': request.GET.get('date_from', ''),
+        'date_to': request.GET.get('date_to', ''),
+    }
+    orders = apply_search(OrderData.objects.all(), filters['search'])
+
+    if filters['status']:
+        try:
+            orders = orders.filter(sent_status=int(filters['status']))
+        except ValueError:
+            logger.warning(f"Ignoring invalid status filter '{filters['status']}'")
+            filters['status'] = ''
+
+    for name in ('date_from', 'date_to'):
+        if not filters[name]:
+            continue
+        try:
+            day = parse_date(filters[name])
+        except ValueError:
+            day = None
+        if day is None:
+            logger.warning(f"Ignoring invalid {name} filter '{filters[name]}'")
+            filters[name] = ''
+        elif name == 'date_from':
+            orders = orders.filter(processed_at__gte=_day_start(day))
+        else:
+            orders = orders.filter(processed_at__lt=_day_start(day + timedelta(days=1)))
+
+    return orders, filters
+
+
+def paginate_grid(request, queryset, sort_by, page_size, page):
+    """
+    Fetch the grid page a request asks for.
+
+    Follows the request's `after` / `before` cursor when it has one and `last=1`
+    jumps to the final page. Without either, `page` is used as an offset up to
+    PAGINATION_MAX_OFFSET_PAGE; deeper page numbers and unreadable cursors fall
+    back to the first page. The returned page also carries the page number shown.
+    """
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+    last = request.GET.get('last') == '1'
+    if not (after or before or last) and page > PAGINATION_MAX_OFFSET_PAGE:
+        logger.warning(f"Page {page} is past the last page reachable by number ({PAGINATION_MAX_OFFSET_PAGE}); showing the first page")
+        page = 1
+    try:
+        grid_page = keyset_paginate(
+            queryset, sort_by, page_size,
+            after=after, before=before, last=last,
+            offset=(page - 1) * page_size,
+        )
+    except InvalidCursor as e:
+        logger.warning(f"{str(e)}; showing the first page")
+        grid_page, page = keyset_paginate(queryset, sort_by, page_size), 1
+    grid_page['page'] = page
+    return grid_page
+
 def home(request):
     """Home view displaying orders and system status"""
     try:
@@ -20,38 +135,40 @@ def home(request):
         search_query = request.GET.get('search', '')
         sort_by = request.GET.get('sort_by', '-processed_at')
         page_size = int(request.GET.get('page_size', '100'))
-        page = int(request.GET.get('page', '1'))
+        page = max(int(request.GET.get('page', '1')), 1)
+        order_sort = resolve_sort(sort_by, ORDER_SORT_FIELDS, '-processed_at')
         
         logger.info(f"Home page accessed. Search: '{search_query}', Sort: '{sort_by}', Page: {page}, Page Size: {page_size}")
         
-        # Base queryset
-        orders = OrderData.objects.all()
+        # Get counts for KPIs in one cached aggregate query
+        kpis = get_order_kpis()
+        total_orders = kpis['total_orders']
+        pending_orders = kpis['pending_orders']
+        sent_orders = kpis['sent_orders']
+        failed_orders = kpis['failed_orders']
         
-        # Apply search if provided
-        if search_query:
-            orders = orders.filter(
-                Q(order_number__icontains=search_query) |
-                Q(item__icontains=search_query)
-            )
-            logger.info(f"Applied search filter. Found {orders.count()} matching orders")
-        
-        # Apply sorting
-        orders = orders.order_by(sort_by)
+        # Apply the grid filters; without any the KPI total is the record count
+        orders, filters = filter_orders(request)
+        if any(filters.values()):
+            total_records = cached_count(orders)
+            logger.info(f"Applied order filters {filters}. Found {total_records} matching orders")
+        else:
+            total_records = total_orders
         
         # Calculate pagination
-        total_records = orders.count()
-        start_idx = (page - 1) * page_size
-        end_idx = start_idx + page_size
         total_pages = (total_records + page_size - 1) // page_size
+        if request.GET.get('last') == '1':
+            page = max(total_pages, 1)
         
-        # Get paginated orders
-        paginated_orders = orders[start_idx:end_idx]
-        
-        # Get counts for KPIs
-        total_orders = OrderData.objects.count()
-        pending_orders = OrderData.objects.filter(Q(sent_status=0) | Q(sent_status__isnull=True)).count()
-        sent_orders = OrderData.objects.filter(sent_status=1).count()
-        failed_orders = OrderData.objects.filter(sent_status=99).count()
+        # Get paginated orders, seeking past the cursor on the sort column
+        order_page = paginate_grid(
+            request,
+            orders.values('id', 'order_number', 'transaction_type', 'item', 'quantity', 'actual_qty',
+                          'sent_status', 'processed_at', 'api_error', 'user', 'order_line', 'shortage_qty'),
+            order_sort, page_size, page,
+        )
+        page = order_page['page']
+        paginated_orders = order_page['items']
         
         # Format environment variables
         db_host = os.getenv('DB_HOST', 'localhost')
@@ -68,15 +185,16 @@ def home(request):
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             logger.debug("AJAX request received, returning JSON response")
             return JsonResponse({
-                'orders': list(paginated_orders.values('id', 'order_number', 'transaction_type',
-                                           'item', 'quantity', 'actual_qty', 'sent_status', 
-                                           'processed_at', 'api_error', 'user', 'order_line',
-                                           'shortage_qty')),
+                'orders': paginated_orders,
                 'pagination': {
                     'page': page,
                     'total_pages': total_pages,
                     'total_records': total_records,
-                    'page_size': page_size
+                    'page_size': page_size,
+                    'has_next': order_page['has_next'],
+                    'has_previous': order_page['has_previous'],
+                    'next_cursor': order_page['next_cursor'],
+                    'previous_cursor': order_page['previous_cursor'],
                 },
                 'kpis': {
                     'total_orders': total_orders,
@@ -93,7 +211,17 @@ def home(request):
             'total_pages': total_pages,
             'page_size': page_size,
             'page_size_options': [50, 100, 200, 500],
+            'has_next': order_page['has_next'],
+            'has_previous': order_page['has_previous'],
+            'next_cursor': order_page['next_cursor'],
+            'previous_cursor': order_page['previous_cursor'],
             'search_query': search_query,
+            'status_filter': filters['status'],
+            'date_from': filters['date_from'],
+            'date_to': filters['date_to'],
+            'status_choices': ORDER_STATUS_CHOICES,
+            'filter_query': urlencode(filters),
+            'export_xlsx_max_rows': EXPORT_XLSX_MAX_ROWS,
             'sort_by': sort_by,
             'total_orders': total_orders,
             'pending_orders': pending_orders,
@@ -146,6 +274,8 @@ def reset_order_status(request, order_id):
         order.sent_status = 0
         order.api_error = None
         order.save()
+        invalidate_order_kpis()
+        publish_order_update('reset_order_status', reset=1)
         logger.info(f"Successfully reset order {order.order_number} (ID: {order.id}) to pending status")
         messages.success(request, f'Order {order.order_number} has been reset to pending status and will be processed in the next API run.')
         
@@ -161,42 +291,41 @@ def reset_order_status(request, order_id):
 
 def inventory(request):
     # Get query parameters
-    page = int(request.GET.get('page', 1))
+    page = max(int(request.GET.get('page', 1)), 1)
     page_size = int(request.GET.get('page_size', 50))
     sort_by = request.GET.get('sort_by', '-import_timestamp')
     search_query = request.GET.get('search', '')
+    inventory_sort = resolve_sort(sort_by, INVENTORY_SORT_FIELDS, '-import_timestamp')
 
     # Base queryset
     queryset = MasterInventory.objects.all()
 
     # Apply search if provided
     if search_query:
-        queryset = queryset.filter(
-            Q(item__icontains=search_query) |
-            Q(description__icontains=search_query)
-        )
+        queryset = apply_search(queryset, search_query)
 
-    # Apply sorting
-    if sort_by.startswith('-'):
-        queryset = queryset.order_by(sort_by, '-import_timestamp')
-    else:
-        queryset = queryset.order_by(sort_by, 'import_timestamp')
+    # Calculate statistics in one cached aggregate query
+    stats = cached_aggregate(
+        queryset,
+        total_records=Count('id'),
+        new_count=Count('id', filter=Q(status=0)),
+        updated_count=Count('id', filter=Q(status=1)),
+        error_count=Count('id', filter=Q(status=2)),
+    )
+    total_records = stats['total_records']
+    new_count = stats['new_count']
+    updated_count = stats['updated_count']
+    error_count = stats['error_count']
 
-    # Create paginator
-    paginator = Paginator(queryset, page_size)
-    
-    # Ensure page number is valid
-    try:
-        page_obj = paginator.page(page)
-    except:
-        page = 1
-        page_obj = paginator.page(page)
+    # Calculate pagination
+    total_pages = max((total_records + page_size - 1) // page_size, 1)
+    if request.GET.get('last') == '1':
+        page = total_pages
 
-    # Calculate statistics
-    total_records = queryset.count()
-    new_count = queryset.filter(status=0).count()
-    updated_count = queryset.filter(status=1).count()
-    error_count = queryset.filter(status=2).count()
+    # Get paginated items, seeking past the cursor on the sort column
+    inventory_page = paginate_grid(request, queryset, inventory_sort, page_size, page)
+    page = inventory_page['page']
+    page_obj = inventory_page['items']
 
     # Get configuration from environment variables
     db_host = os.getenv('DB_HOST', 'localhost')
@@ -209,8 +338,12 @@ def inventory(request):
         'page': page,
         'page_size': page_size,
         'page_size_options': [25, 50, 100, 250],
-        'total_pages': paginator.num_pages,
+        'total_pages': total_pages,
         'total_records': total_records,
+        'has_next': inventory_page['has_next'],
+        'has_previous': inventory_page['has_previous'],
+        'next_cursor': inventory_page['next_cursor'],
+        'previous_cursor': inventory_page['previous_cursor'],
         'new_count': new_count,
         'updated_count': updated_count,
         'error_count': error_count,
@@ -239,8 +372,12 @@ def inventory(request):
             'pagination': {
                 'page': page,
                 'page_size': page_size,
-                'total_pages': paginator.num_pages,
+                'total_pages': total_pages,
                 'total_records': total_records,
+                'has_next': inventory_page['has_next'],
+                'has_previous': inventory_page['has_previous'],
+                'next_cursor': inventory_page['next_cursor'],
+                'previous_cursor': inventory_page['previous_cursor'],
             }
         }
         return JsonResponse(data)
@@ -252,4 +389,47 @@ def reset_inventory_status(request, item_id):
     inventory_item = get_object_or_404(MasterInventory, id=item_id)
     inventory_item.status = 0
     inventory_item.save()
+    publish_inventory_update('reset_inventory_status', reset=1)
     return redirect('portal:inventory')
+
+@login_required
+def event_stream(request):
+    """Server-sent events feeding the live order and inventory dashboards"""
+    response = StreamingHttpResponse(stream_events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx and similar proxies from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@login_required
+def export_orders(request):
+    """
+    Stream the orders matching the home page filters and sort as CSV or XLSX.
+
+    Rows are read with a database iterator, so memory stays flat however many
+    rows match. CSV is written out as rows arrive and has no size limit. An
+    XLSX workbook is only sent once it is complete, so exports of more than
+    EXPORT_XLSX_MAX_ROWS rows are refused with a message pointing to CSV.
+    """
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        export_format = 'csv'
+    content_type, stream = EXPORT_FORMATS[export_format]
+
+    orders, filters = filter_orders(request)
+    order_sort = resolve_sort(request.GET.get('sort_by', '-processed_at'), ORDER_SORT_FIELDS, '-processed_at')
+    lines = orders.order_by(order_sort, '-pk' if order_sort.startswith('-') else 'pk').values_list(*EXPORT_FIELDS)
+
+    # One row past the limit tells whether it is exceeded, without counting every match
+    if export_format == 'xlsx' and lines[EXPORT_XLSX_MAX_ROWS:EXPORT_XLSX_MAX_ROWS + 1].exists():
+        logger.warning(f"Refused XLSX order export of more than {EXPORT_XLSX_MAX_ROWS} rows. Filters: {filters}")
+        messages.error(request, f"More than {EXPORT_XLSX_MAX_ROWS:,} orders match. Export them as CSV, "
+                                f"or narrow the filters to export XLSX.")
+        return redirect(f"{reverse('portal:home')}?{urlencode(dict(filters, sort_by=request.GET.get('sort_by', '')))}")
+
+    logger.info(f"Streaming {export_format} order export. Filters: {filters}, Sort: '{order_sort}'")
+    rows = (export_row(line) for line in lines.iterator(chunk_size=EXPORT_FETCH_SIZE))
+    response = StreamingHttpResponse(stream(EXPORT_HEADERS, rows), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="orders_{timezone.localtime():%Y%m%d_%H%M%S}.{export_format}"'
+    response['X-Accel-Buffering'] = 'no'
+    return response